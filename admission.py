@@ -0,0 +1,227 @@
+import asyncio
+import contextlib
+import math
+import os
+import time
+from collections import Counter, deque
+from typing import Dict, Optional
+
+from fastapi import Request, status
+from fastapi.responses import JSONResponse
+
+from templating import templates
+
+# Slots for ordinary requests. replica_concurrency in cerebrium.toml is this plus
+# MAX_SUBSCRIBERS (events.py) for open /events streams
+REPLICA_CONCURRENCY = int(os.getenv("REPLICA_CONCURRENCY", "10"))
+
+# bcrypt releases the GIL, so one hash per CPU plus one more keeps every CPU busy
+# while a login does its database lookup. More would only slow page loads; it
+# also stays within asyncio's default thread pool (CPUs + 4 threads)
+AUTH_CONCURRENCY = int(os.getenv("AUTH_CONCURRENCY", str((os.cpu_count() or 1) + 1)))
+
+AUTH = "auth"    # Login, and registration's password hashing: bcrypt, CPU-heavy
+ADMIN = "admin"  # Admin actions: pairing changes, DB-heavy
+READ = "read"    # Pages and admin metrics: cheap
+
+# Never queued or shed: health checks, static files, and long-lived /events streams (capped separately)
+EXEMPT_PATHS = {"/healthz", "/events"}
+EXEMPT_PREFIXES = ("/static/",)
+
+# Why a request was turned away with a 503
+QUEUE_FULL = "queue_full"    # Too many already waiting
+PREDICTED_LATE = "predicted_late"  # Its queue position means it would miss its deadline
+DEADLINE = "deadline"        # Waited its full deadline without getting a slot
+
+SERVICE_TIME_WEIGHT = 0.2  # Weight of the latest request in the moving average service time
+
+
+class Shed(Exception):
+    """Raised by RouteClass.limit() when work is turned away."""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class RouteClass:
+    """
+    A concurrency limit for one class of routes, with a bounded FIFO queue. Queued
+    requests that can't start within `max_wait_seconds` get a 503 instead of
+    tying up the replica.
+    """
+
+    def __init__(self, name: str, concurrency: int, queue_size: int, max_wait_seconds: float):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.max_wait_seconds = max_wait_seconds
+        self.active = 0
+        self.waiters: deque = deque()
+        self.service_seconds = 0.0
+
+        self.admitted = 0
+        self.queued = 0
+        self.shed: Counter = Counter()
+        self.max_queued_seconds = 0.0
+
+    def retry_after(self) -> int:
+        """Seconds a shed client is asked to wait before trying again."""
+        return math.ceil(self.max_wait_seconds)
+
+    def predicted_wait(self) -> float:
+        """How long a request joining the queue now should expect to wait."""
+        return (len(self.waiters) + 1) / self.concurrency * self.service_seconds
+
+    async def acquire(self) -> Optional[str]:
+        """Wait for a slot. Returns None once admitted, otherwise why the request was shed."""
+        if self.active < self.concurrency and not self.waiters:
+            self.active += 1
+            self.admitted += 1
+            return None
+        if len(self.waiters) >= self.queue_size:
+            self.shed[QUEUE_FULL] += 1
+            return QUEUE_FULL
+        if self.predicted_wait() > self.max_wait_seconds:
+            self.shed[PREDICTED_LATE] += 1
+            return PREDICTED_LATE
+
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(waiter, self.max_wait_seconds)
+        except asyncio.TimeoutError:
+            # On Python 3.12+ the deadline can fire after release() handed this
+            # request the slot; it's ours then, so take it rather than leak it
+            if not waiter.done() or waiter.cancelled():
+                self.shed[DEADLINE] += 1
+                return DEADLINE
+        except BaseException:
+            # Cancelled (e.g. client went away) just as a slot was handed over
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            raise
+        finally:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+        self.max_queued_seconds = max(self.max_queued_seconds, time.perf_counter() - start)
+        self.admitted += 1
+        return None
+
+    def release(self, service_seconds: Optional[float] = None):
+        """Free a slot, handing it straight to the next queued request if there is one."""
+        if service_seconds is not None:
+            if self.service_seconds:
+                self.service_seconds += SERVICE_TIME_WEIGHT * (service_seconds - self.service_seconds)
+            else:
+                self.service_seconds = service_seconds
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    @contextlib.asynccontextmanager
+    async def limit(self):
+        """Hold a slot for the duration of the block, for routes that limit only part of their work."""
+        reason = await self.acquire()
+        if reason is not None:
+            raise Shed(reason, self.retry_after())
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - start)
+
+    def metrics(self) -> Dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_size": self.queue_size,
+            "max_wait_seconds": self.max_wait_seconds,
+            "active": self.active,
+            "waiting": len(self.waiters),
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "shed": dict(self.shed),
+            "max_queued_ms": round(self.max_queued_seconds * 1000, 3),
+            "service_ms": round(self.service_seconds * 1000, 3),
+        }
+
+
+# Logins and sign-ups use the whole bcrypt budget and queue a launch-day burst
+# rather than shedding it; reshuffles run one at a time
+route_classes = {
+    AUTH: RouteClass(AUTH, concurrency=AUTH_CONCURRENCY, queue_size=200, max_wait_seconds=15.0),
+    ADMIN: RouteClass(ADMIN, concurrency=1, queue_size=1, max_wait_seconds=5.0),
+    READ: RouteClass(READ, concurrency=REPLICA_CONCURRENCY, queue_size=REPLICA_CONCURRENCY, max_wait_seconds=1.0),
+}
+
+
+def classify(method: str, path: str) -> Optional[str]:
+    """The route class a request belongs to, or None if it bypasses admission control."""
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if method == "POST" and path == "/register":
+        # Limited around its bcrypt step only, so sign-ups waiting on the group
+        # commit don't hold auth slots and can gather into one batch
+        return None
+    if method == "POST" and path == "/login":
+        return AUTH
+    if method == "POST" and path.startswith("/admin/"):
+        return ADMIN
+    return READ
+
+
+def get_metrics() -> Dict:
+    """Counters for the admin metrics endpoint."""
+    return {name: route_class.metrics() for name, route_class in route_classes.items()}
+
+
+def server_busy(request: Request, retry_after: int):
+    """Shed login/registration attempts get the login page back with an error, not JSON."""
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "error": "We're very busy right now. Please try again in a few seconds.",
+        },
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(retry_after)},
+    )
+
+
+class AdmissionMiddleware:
+    """Admits each request under its route class's limit, or sheds it with a 503."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        name = classify(scope["method"], scope["path"])
+        if name is None:
+            return await self.app(scope, receive, send)
+
+        route_class = route_classes[name]
+        reason = await route_class.acquire()
+        if reason is not None:
+            if name == AUTH:
+                response = server_busy(Request(scope), route_class.retry_after())
+            else:
+                response = JSONResponse(
+                    {"detail": "The server is busy. Please try again in a moment."},
+                    status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": str(route_class.retry_after())},
+                )
+            return await response(scope, receive, send)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            route_class.release(time.perf_counter() - start)
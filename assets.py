@@ -0,0 +1,135 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+
+# Brotli is optional - without it clients that only get gzip still save most of the bytes
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "static"
+STATIC_URL = "/static/"
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "no-cache"
+
+COMPRESSIBLE_TYPES = ("text/", "application/javascript", "application/json", "image/svg+xml")
+
+
+def accepted_encodings(request: Request) -> Dict[str, float]:
+    """Accept-Encoding as coding -> q-value, e.g. "gzip;q=0.5, br" -> {"gzip": 0.5, "br": 1.0}."""
+    codings = {}
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def accepts_encoding(request: Request, coding: str) -> bool:
+    """Whether the client will take `coding`. q=0 is a refusal, and "*" covers anything not listed."""
+    codings = accepted_encodings(request)
+    return codings.get(coding, codings.get("*", 0.0)) > 0
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether If-None-Match lists this ETag (weak comparison, as for GET revalidation)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    return header.strip() == "*" or etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+class Asset:
+    """One static file held in memory with its precompressed variants."""
+
+    def __init__(self, body: bytes, media_type: str):
+        self.body = body
+        self.media_type = media_type
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.gzipped = None
+        self.brotli = None
+        if media_type.startswith(COMPRESSIBLE_TYPES):
+            self.gzipped = gzip.compress(body, compresslevel=9)
+            if brotli is not None:
+                self.brotli = brotli.compress(body, quality=11)
+
+
+def fingerprinted_name(path: str, digest: str) -> str:
+    """styles.css -> styles.<digest>.css"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{digest}{ext}"
+
+
+class StaticAssets:
+    """
+    Loads every file under the static directory at startup, content-hashes
+    its name and keeps gzip/brotli variants, so responses are plain memory reads.
+    """
+
+    def __init__(self, directory: str):
+        self.assets: Dict[str, Asset] = {}       # logical path -> asset
+        self.fingerprinted: Dict[str, str] = {}  # fingerprinted path -> logical path
+        for root, _, files in os.walk(directory):
+            for filename in files:
+                full_path = os.path.join(root, filename)
+                path = os.path.relpath(full_path, directory).replace(os.sep, "/")
+                media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+                with open(full_path, "rb") as f:
+                    asset = Asset(f.read(), media_type)
+                self.assets[path] = asset
+                self.fingerprinted[fingerprinted_name(path, asset.digest)] = path
+
+    def url(self, path: str) -> str:
+        """URL of the fingerprinted copy of a static file, for use in templates."""
+        asset = self.assets.get(path)
+        if asset is None:
+            return STATIC_URL + path
+        return STATIC_URL + fingerprinted_name(path, asset.digest)
+
+    def response(self, request: Request, path: str) -> Optional[Response]:
+        """Serve a static file, or return None if it doesn't exist."""
+        if path in self.fingerprinted:
+            # The name changes whenever the content does, so browsers never need to ask again
+            asset = self.assets[self.fingerprinted[path]]
+            cache_control = IMMUTABLE_CACHE
+        elif path in self.assets:
+            asset = self.assets[path]
+            cache_control = REVALIDATE_CACHE
+        else:
+            return None
+
+        # Each encoding is a different representation, so each gets its own ETag
+        if asset.brotli is not None and accepts_encoding(request, "br"):
+            body, encoding, etag = asset.brotli, "br", f'"{asset.digest}-br"'
+        elif asset.gzipped is not None and accepts_encoding(request, "gzip"):
+            body, encoding, etag = asset.gzipped, "gzip", f'"{asset.digest}-gz"'
+        else:
+            body, encoding, etag = asset.body, None, f'"{asset.digest}"'
+
+        headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type=asset.media_type, headers=headers)
+
+
+os.makedirs(STATIC_DIR, exist_ok=True)
+static_assets = StaticAssets(STATIC_DIR)
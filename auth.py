@@ -1,6 +1,10 @@
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import os
+import threading
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 from models import User
@@ -15,6 +19,26 @@ SECRET_KEY = "your-secret-key-change-in-production"  # Change this in production
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 7  # 7 days
 
+# Scheduling priority of the bcrypt threads (19 = lowest). On a shared CPU the
+# event loop thread, and so every cheap page, runs first; bcrypt gets what's left
+BCRYPT_NICE = int(os.getenv("BCRYPT_NICE", "19"))
+
+
+def _lower_thread_priority():
+    try:
+        # On Linux a nice value set for a thread id applies to that thread only
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), BCRYPT_NICE)
+    except (AttributeError, OSError):
+        pass  # Not supported here; hash at normal priority
+
+
+_bcrypt_pool = ThreadPoolExecutor(thread_name_prefix="bcrypt", initializer=_lower_thread_priority)
+
+
+async def run_bcrypt(func, *args):
+    """Run a password hash or check off the event loop, on the low-priority bcrypt threads."""
+    return await asyncio.get_running_loop().run_in_executor(_bcrypt_pool, func, *args)
+
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash."""
@@ -0,0 +1,67 @@
+"""
+Checks that every admin statistic is computed by exactly one SQL query (never by
+loading rows into Python) and that cached reads issue none, then times each
+stat at increasing member counts.
+"""
+from sqlalchemy import event, insert
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from database import SessionLocal, engine, init_db  # noqa: E402
+from exchanges import init_default_exchange  # noqa: E402
+from models import User  # noqa: E402
+from pairing import create_pairings  # noqa: E402
+import stats  # noqa: E402
+
+MEMBER_COUNTS = [100, 10000, 50000]
+STATS = [stats.member_counts, stats.gifter_counts, stats.receivers_without_gifter, stats.registrations_by_day]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(engine, "before_cursor_execute", self.on_execute)
+
+    def on_execute(self, *args):
+        self.count += 1
+
+    def measure(self, func):
+        before = self.count
+        func()
+        return self.count - before
+
+
+def main():
+    init_db()
+    db = SessionLocal()
+    init_default_exchange(db)
+    counter = QueryCounter()
+
+    added = 0
+    for members in MEMBER_COUNTS:
+        db.execute(insert(User), [
+            {"first_name": "M", "last_name": str(i), "email": f"m{i}@example.com", "phone_number": "1",
+             "hashed_password": "x", "is_admin": i == 0, "exchange_id": 1}
+            for i in range(added, members)
+        ])
+        db.commit()
+        added = members
+        create_pairings(db, 1)
+        print(f"-- {members} members")
+
+        for stat in STATS:
+            queries = counter.measure(lambda: stat(db, 1))
+            assert queries == 1, f"{stat.__name__} issued {queries} queries"
+            timed(f"{stat.__name__} (1 query)", lambda: stat(db, 1), repeat=5)
+
+        stats.invalidate_stats(1)
+        assert counter.measure(lambda: stats.get_stats(db, 1)) == len(STATS)
+        assert counter.measure(lambda: stats.get_stats(db, 1)) == 0, "cached stats hit the database"
+    print(stats.get_stats(db, 1) | {"registrations_by_day": "..."})
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""
+Saturate login (bcrypt) while timing dashboard loads, with and without admission
+control, pinned to one CPU like a Cerebrium replica. bcrypt runs on low-priority
+threads, so the dashboard's p50 should hold; its p99 still rises somewhat, since
+the event loop handles every login request too.
+"""
+import asyncio
+import contextlib
+import io
+import os
+import statistics
+import time
+from collections import Counter
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+import httpx  # noqa: E402
+
+import admission  # noqa: E402
+import main as app_module  # noqa: E402
+import ratelimit  # noqa: E402
+from admission import AdmissionMiddleware  # noqa: E402
+from auth import create_access_token, get_password_hash  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from exchanges import DEFAULT_EXCHANGE_SLUG, get_exchange_id  # noqa: E402
+from models import User  # noqa: E402
+
+DURATION_SECONDS = 10
+LOGIN_WORKERS = 20     # Clients retrying login as fast as they can
+READERS = 4            # Clients loading their dashboard back to back
+SHED_BACKOFF_SECONDS = 0.05
+
+
+def create_member() -> int:
+    db = SessionLocal()
+    user = User(
+        first_name="Load", last_name="Test", email="load@example.com", phone_number="1",
+        hashed_password=get_password_hash("pw"), is_admin=False,
+        exchange_id=get_exchange_id(db, DEFAULT_EXCHANGE_SLUG),
+    )
+    db.add(user)
+    db.commit()
+    user_id = user.id
+    db.close()
+    return user_id
+
+
+async def flood_logins(client: httpx.AsyncClient, stop: asyncio.Event, statuses: Counter):
+    while not stop.is_set():
+        response = await client.post("/login", data={"email": "load@example.com", "password": "pw"})
+        statuses[response.status_code] += 1
+        if response.status_code == 503:
+            await asyncio.sleep(SHED_BACKOFF_SECONDS)
+
+
+async def load_dashboards(client: httpx.AsyncClient, stop: asyncio.Event, latencies: list, statuses: Counter):
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.get("/dashboard")
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] += 1
+
+
+async def run(label: str, cookies: dict, logins: bool):
+    transport = httpx.ASGITransport(app=app_module.app)
+    stop = asyncio.Event()
+    latencies, read_statuses, login_statuses = [], Counter(), Counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", cookies=cookies) as client:
+        workers = [load_dashboards(client, stop, latencies, read_statuses) for _ in range(READERS)]
+        if logins:
+            workers += [flood_logins(client, stop, login_statuses) for _ in range(LOGIN_WORKERS)]
+        tasks = [asyncio.create_task(worker) for worker in workers]
+        await asyncio.sleep(DURATION_SECONDS)
+        stop.set()
+        await asyncio.gather(*tasks)
+
+    percentiles = statistics.quantiles(latencies, n=100)
+    return (f"{label:<32} dashboard p50 {percentiles[49] * 1000:8.1f} ms  p99 {percentiles[98] * 1000:8.1f} ms  "
+            f"({len(latencies)} loads, {dict(read_statuses)})  logins {dict(login_statuses)}")
+
+
+def use_admission_control(enabled: bool):
+    app = app_module.app
+    if not hasattr(app.state, "all_middleware"):
+        app.state.all_middleware = list(app.user_middleware)
+    app.user_middleware = [
+        m for m in app.state.all_middleware if enabled or m.cls is not AdmissionMiddleware
+    ]
+    app.middleware_stack = None  # Rebuilt on the next request
+
+
+async def main():
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {min(os.sched_getaffinity(0))})
+    # Measure the concurrency limits, not the per-IP/email login throttling
+    for limiter in ratelimit.limiters:
+        limiter.capacity = float("inf")
+
+    cookies = {"access_token": create_access_token(data={"sub": str(create_member())})}
+    results = []
+    # The app's DEBUG prints would otherwise dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        use_admission_control(False)
+        results.append(await run("no login load", cookies, logins=False))
+        results.append(await run("logins, no admission control", cookies, logins=True))
+        use_admission_control(True)
+        results.append(await run("logins, admission control", cookies, logins=True))
+    print("\n".join(results))
+    print(admission.get_metrics())
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
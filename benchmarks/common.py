@@ -0,0 +1,34 @@
+"""
+Shared setup for the benchmark scripts.
+
+Run benchmarks from the repository root, e.g. `python -m benchmarks.sse_connections`.
+They always use a throwaway SQLite database, never the DATABASE_URL you deploy with.
+Set BENCH_DB_LATENCY_MS (and optionally BENCH_DB_JITTER_MS, BENCH_DB_CONNECT_MS) to
+add simulated network round-trip time to it; see benchmarks/latency.py.
+"""
+import os
+import tempfile
+import time
+
+from benchmarks.latency import install_from_env
+
+
+def use_scratch_database():
+    """
+    Point the app at a fresh SQLite file, with simulated latency if configured.
+    Must be called before importing app modules.
+    """
+    path = os.path.join(tempfile.mkdtemp(prefix="santa-bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    install_from_env()
+    return path
+
+
+def timed(label: str, func, repeat: int = 1):
+    """Run func `repeat` times and print the mean wall time per call."""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<45} {elapsed / repeat * 1000:10.3f} ms/call  ({repeat} calls)")
+    return elapsed / repeat
@@ -0,0 +1,136 @@
+"""
+Simulated database round-trip latency for benchmarks.
+
+Local SQLite answers in microseconds, so per-request sessions, pool_pre_ping
+and chatty query patterns cost nothing on a laptop. They add up quickly against
+serverless Postgres (Neon). LatencyInjector delays and counts every round trip
+the app makes: statements, commits, rollbacks, pre-ping checks. It also delays
+opening each new connection.
+
+Any benchmark can run against it by setting environment variables:
+
+    BENCH_DB_LATENCY_MS=20 BENCH_DB_JITTER_MS=5 BENCH_DB_CONNECT_MS=150 \\
+        python -m benchmarks.admin_stats_queries
+"""
+import atexit
+import os
+import random
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# The injector installed from the environment by install_from_env(), if any
+active: Optional["LatencyInjector"] = None
+
+STATEMENT = "statement"
+COMMIT = "commit"
+ROLLBACK = "rollback"
+PING = "ping"
+CONNECT = "connect"
+
+
+class LatencyInjector:
+    """
+    Sleeps for `latency_ms` ± `jitter_ms` on every round trip and `connect_ms`
+    on every new connection. Hooks in at the SQLAlchemy Engine and Pool class
+    level, so it covers engines created after install() too. It works the
+    same way in front of a local Postgres.
+    """
+
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, connect_ms: float = 0,
+                 seed: Optional[int] = None):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.connect = connect_ms / 1000
+        self.rng = random.Random(seed)
+        self.round_trips: Counter = Counter()
+        self.injected_seconds = 0.0
+        self.fresh_connections = set()
+        # DBAPI connections with a transaction open. Like psycopg2, a commit or
+        # rollback with nothing open costs no round trip
+        self.in_transaction = set()
+        self.listeners = [
+            (Engine, "before_cursor_execute", self.on_statement),
+            (Engine, "commit", self.on_commit),
+            (Engine, "rollback", self.on_rollback),
+            (Pool, "connect", self.on_connect),
+            (Pool, "checkout", self.on_checkout),
+            (Pool, "reset", self.on_reset),
+        ]
+
+    def install(self) -> "LatencyInjector":
+        for target, name, listener in self.listeners:
+            event.listen(target, name, listener)
+        return self
+
+    def uninstall(self):
+        for target, name, listener in self.listeners:
+            event.remove(target, name, listener)
+
+    def round_trip(self, kind: str, seconds: Optional[float] = None):
+        if seconds is None:
+            seconds = max(0.0, self.latency + self.rng.uniform(-self.jitter, self.jitter))
+        self.round_trips[kind] += 1
+        self.injected_seconds += seconds
+        time.sleep(seconds)
+
+    def end_transaction(self, dbapi_connection, kind: str):
+        if id(dbapi_connection) in self.in_transaction:
+            self.in_transaction.discard(id(dbapi_connection))
+            self.round_trip(kind)
+
+    def on_statement(self, conn, cursor, statement, parameters, context, executemany):
+        self.in_transaction.add(id(conn.connection.dbapi_connection))
+        self.round_trip(STATEMENT)
+
+    def on_commit(self, conn):
+        self.end_transaction(conn.connection.dbapi_connection, COMMIT)
+
+    def on_rollback(self, conn):
+        self.end_transaction(conn.connection.dbapi_connection, ROLLBACK)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        self.fresh_connections.add(id(connection_record))
+        self.round_trip(CONNECT, self.connect)
+
+    def on_checkout(self, dbapi_connection, connection_record, connection_proxy):
+        # The pool pings every checkout except a brand new connection's first
+        if id(connection_record) in self.fresh_connections:
+            self.fresh_connections.discard(id(connection_record))
+        elif connection_proxy._pool._pre_ping:
+            # The ping's SELECT 1 opens a transaction, as any statement does
+            self.in_transaction.add(id(dbapi_connection))
+            self.round_trip(PING)
+
+    def on_reset(self, dbapi_connection, connection_record, reset_state):
+        # Rollback-on-return
+        self.end_transaction(dbapi_connection, ROLLBACK)
+
+    def take_counts(self) -> Counter:
+        """Round trips since the last call, by kind."""
+        counts, self.round_trips = self.round_trips, Counter()
+        return counts
+
+    def summary(self) -> str:
+        counts = ", ".join(f"{count} {kind}" for kind, count in sorted(self.round_trips.items()))
+        return (f"simulated database: {sum(self.round_trips.values())} round trips ({counts or 'none'}), "
+                f"{self.injected_seconds:.3f} s of injected latency")
+
+
+def install_from_env() -> Optional[LatencyInjector]:
+    """Install an injector if BENCH_DB_LATENCY_MS / _JITTER_MS / _CONNECT_MS are set."""
+    global active
+    settings = {
+        name: float(os.getenv(f"BENCH_DB_{name.upper()}", "0"))
+        for name in ("latency_ms", "jitter_ms", "connect_ms")
+    }
+    if not any(settings.values()):
+        return None
+    active = LatencyInjector(**settings).install()
+    print(f"Injecting database latency: {settings}")
+    atexit.register(lambda: print(active.summary()))
+    return active
@@ -0,0 +1,92 @@
+"""
+Per-exchange cost as the number of exchanges on one database grows: pairing
+creation, the dashboard's roster query and a pairing index load for a single
+exchange, then the same operations run concurrently across all exchanges.
+"""
+import asyncio
+import time
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from sqlalchemy import insert  # noqa: E402
+
+from database import SessionLocal, init_db  # noqa: E402
+from models import Exchange, User  # noqa: E402
+from pairing import create_pairings  # noqa: E402
+from pairing_index import load_pairing_index  # noqa: E402
+
+MEMBERS_PER_EXCHANGE = 200
+EXCHANGE_COUNTS = [1, 10, 100]
+
+
+def add_exchanges(db, start: int, stop: int):
+    exchanges = [
+        Exchange(slug=f"exchange-{n}", name=f"Exchange {n}", registration_open=True)
+        for n in range(start, stop)
+    ]
+    db.add_all(exchanges)
+    db.flush()
+    # Sign-ups for different exchanges arrive interleaved, so each exchange's
+    # user ids are spread across the whole id range
+    db.execute(insert(User), [
+        {
+            "first_name": "Member",
+            "last_name": str(i),
+            "email": f"member{i}@{exchange.slug}.example.com",
+            "phone_number": "555-0100",
+            "hashed_password": "x",
+            "is_admin": False,
+            "exchange_id": exchange.id,
+        }
+        for i in range(MEMBERS_PER_EXCHANGE)
+        for exchange in exchanges
+    ])
+    db.commit()
+
+
+def exchange_ids(db):
+    return [exchange_id for (exchange_id,) in db.query(Exchange.id)]
+
+
+def dashboard_reads(exchange_id: int):
+    db = SessionLocal()
+    try:
+        db.query(User).filter(User.exchange_id == exchange_id).all()
+        load_pairing_index(db, exchange_id, version=0)
+    finally:
+        db.close()
+
+
+async def concurrent_dashboards(ids):
+    await asyncio.gather(*(asyncio.to_thread(dashboard_reads, exchange_id) for exchange_id in ids))
+
+
+def main():
+    init_db()
+    db = SessionLocal()
+    created = 0
+    for count in EXCHANGE_COUNTS:
+        add_exchanges(db, created, count)
+        created = count
+        ids = exchange_ids(db)
+        target = ids[len(ids) // 2]
+        total = count * MEMBERS_PER_EXCHANGE
+
+        print(f"-- {count} exchanges, {total} members total")
+        timed("create_pairings (one exchange)", lambda: create_pairings(db, target), repeat=5)
+        timed("dashboard reads (one exchange)", lambda: dashboard_reads(target), repeat=20)
+        index = load_pairing_index(db, target, version=0)
+        print(f"{'pairing index size (one exchange)':<45} {index.nbytes() / 1024:10.1f} KiB")
+
+        start = time.perf_counter()
+        asyncio.run(concurrent_dashboards(ids))
+        elapsed = time.perf_counter() - start
+        print(f"{'dashboard reads, all exchanges concurrently':<45} {elapsed * 1000:10.3f} ms total "
+              f"({elapsed / count * 1000:.3f} ms per exchange)")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
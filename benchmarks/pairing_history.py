@@ -0,0 +1,55 @@
+"""
+Pairing history lookups as history grows: loading the "avoid recent matches"
+set for the last K rounds, checking one pair against it, and the single-pair
+indexed query - across member counts and numbers of past rounds.
+"""
+import random
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from database import SessionLocal, init_db  # noqa: E402
+from models import Exchange  # noqa: E402
+from pairing_history import load_recent_matches, match_key, record_pairings, was_matched_recently  # noqa: E402
+
+MEMBER_COUNTS = [1000, 10000]
+ROUND_COUNTS = [1, 10, 40]
+RECENT_ROUNDS = 3
+
+
+def add_rounds(db, exchange_id: int, members: int, start: int, stop: int):
+    ids = list(range(1, members + 1))
+    for round in range(start + 1, stop + 1):
+        random.shuffle(ids)
+        record_pairings(db, exchange_id, round, ((ids[i], ids[(i + 1) % members]) for i in range(members)))
+    db.commit()
+
+
+def main():
+    init_db()
+    db = SessionLocal()
+    for members in MEMBER_COUNTS:
+        exchange = Exchange(slug=f"history-{members}", name=f"{members} members")
+        db.add(exchange)
+        db.commit()
+
+        rounds = 0
+        for target in ROUND_COUNTS:
+            add_rounds(db, exchange.id, members, rounds, target)
+            rounds = target
+            print(f"-- {members} members, {rounds} rounds of history ({members * rounds} rows)")
+
+            recent = load_recent_matches(db, exchange.id, RECENT_ROUNDS)
+            timed(f"load last {RECENT_ROUNDS} rounds ({len(recent)} matches)",
+                  lambda: load_recent_matches(db, exchange.id, RECENT_ROUNDS), repeat=5)
+
+            pairs = [(random.randint(1, members), random.randint(1, members)) for _ in range(10000)]
+            timed("in-memory check x10000", lambda: [match_key(a, b) in recent for a, b in pairs], repeat=20)
+            timed("indexed single-pair query",
+                  lambda: was_matched_recently(db, exchange.id, *pairs[0], rounds=RECENT_ROUNDS), repeat=200)
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+"""
+Memory and lookup cost of the in-process pairing index at 100k members,
+compared with holding the same assignments as a dict of Python objects.
+"""
+import random
+import tracemalloc
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from pairing_index import Assignment, PairingIndex  # noqa: E402
+
+MEMBERS = 100_000
+
+
+def fake_rows(members: int):
+    ids = list(range(1, members + 1))
+    random.shuffle(ids)
+    for i, gifter_id in enumerate(ids):
+        receiver_id = ids[(i + 1) % members]
+        yield (gifter_id, receiver_id, f"First{receiver_id}", f"Last{receiver_id}",
+               f"member{receiver_id}@example.com", f"555-{receiver_id:07d}")
+
+
+def main():
+    rows = list(fake_rows(MEMBERS))
+
+    tracemalloc.start()
+    index = PairingIndex(1, rows)
+    index_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    as_dict = {row[0]: Assignment(*row[1:]) for row in rows}
+    dict_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    print(f"{MEMBERS} members: index {index.nbytes() / 1024 / 1024:.2f} MiB "
+          f"(traced {index_bytes / 1024 / 1024:.2f} MiB), "
+          f"dict of objects {dict_bytes / 1024 / 1024:.2f} MiB")
+
+    gifters = [random.randint(1, MEMBERS) for _ in range(1000)]
+    timed("index lookup x1000", lambda: [index.lookup(g) for g in gifters], repeat=100)
+    timed("index has_pairing x1000", lambda: [index.has_pairing(g) for g in gifters], repeat=100)
+    timed("index rebuild", lambda: PairingIndex(2, rows), repeat=3)
+    assert index.lookup(rows[0][0]).email == rows[0][4]
+
+
+if __name__ == "__main__":
+    main()
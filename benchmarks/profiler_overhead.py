@@ -0,0 +1,71 @@
+"""
+Request latency with the profiler middleware idle, sampling a fraction of
+requests in the background, and profiling every request, compared with the app
+built without the middleware.
+"""
+import contextlib
+import io
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main as app_module  # noqa: E402
+import profiler  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from models import User  # noqa: E402
+
+REQUESTS = 300
+MEMBERS = 200
+PATHS = ["/healthz", "/dashboard"]
+
+
+def get_quietly(client: TestClient, path: str, headers: dict):
+    # The app's DEBUG prints would otherwise dominate the timings
+    with contextlib.redirect_stdout(io.StringIO()):
+        client.get(path, headers=headers)
+
+
+def log_in_as_admin(client: TestClient):
+    for i in range(MEMBERS):
+        client.post("/register", data={
+            "first_name": "M", "last_name": str(i), "email": f"m{i}@example.com",
+            "phone_number": "1", "password": "pw",
+        }, follow_redirects=False)
+    db = SessionLocal()
+    db.query(User).filter(User.email == "m0@example.com").update({"is_admin": True})
+    db.commit()
+    db.close()
+    client.cookies.clear()
+    client.post("/login", data={"email": "m0@example.com", "password": "pw"}, follow_redirects=False)
+    client.post("/admin/create-pairings", follow_redirects=False)
+
+
+def main():
+    app = app_module.app
+    middleware = list(app.user_middleware)
+    cases = [
+        ("no middleware", [], 0, {}),
+        ("profiler idle", middleware, 0, {}),
+        ("1% sampled in background", middleware, 0.01, {}),
+        ("every request profiled", middleware, 0, {"X-Profile": "1"}),
+    ]
+
+    with TestClient(app) as client:
+        with contextlib.redirect_stdout(io.StringIO()):
+            log_in_as_admin(client)
+        for label, stack, sample_rate, headers in cases:
+            app.user_middleware = stack
+            app.middleware_stack = None  # Rebuilt on the next request
+            profiler.PROFILE_SAMPLE_RATE = sample_rate
+            for path in PATHS:
+                timed(f"{path} ({label})", lambda: get_quietly(client, path, headers), repeat=REQUESTS)
+
+    assert not profiler.profiler.active, "profiles left running"
+    print(f"{len(profiler.profiler.reports)} reports kept")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Launch-day burst: registrations per second through the old one-transaction-per-
+sign-up path vs. the group-commit pipeline. Password hashing is left out (both
+paths pay it equally) so the numbers reflect database round trips and commits.
+"""
+import asyncio
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from database import SessionLocal, init_db  # noqa: E402
+from models import User, Settings  # noqa: E402
+from registration import registrations  # noqa: E402
+from exchanges import init_default_exchange  # noqa: E402
+
+BURST_SIZE = 500
+HASHED_PASSWORD = "$2b$12$" + "x" * 53
+
+
+def sign_up(run: str, i: int):
+    return {
+        "first_name": "Bench",
+        "last_name": str(i),
+        "email": f"{run}-{i}@example.com",
+        "phone_number": "555-0100",
+        "hashed_password": HASHED_PASSWORD,
+        "is_admin": False,
+        "exchange_id": 1,
+    }
+
+
+def register_one(row):
+    """The previous /register path: settings query, email pre-check, insert, commit, refresh."""
+    db = SessionLocal()
+    try:
+        setting = db.query(Settings).filter(Settings.key == "registration_open").first()
+        if setting and setting.value.lower() != "true":
+            return None
+        if db.query(User).filter(User.email == row["email"]).first():
+            return None
+        user = User(**row)
+        db.add(user)
+        db.commit()
+        db.refresh(user)
+        return user.id
+    finally:
+        db.close()
+
+
+async def burst(label, register):
+    start = time.perf_counter()
+    results = await asyncio.gather(*(register(i) for i in range(BURST_SIZE)))
+    elapsed = time.perf_counter() - start
+    created = sum(1 for r in results if isinstance(r, int))
+    print(f"{label:<28} {BURST_SIZE / elapsed:10.1f} registrations/s  ({created} created)")
+
+
+async def main():
+    init_db()
+    db = SessionLocal()
+    db.add(Settings(key="registration_open", value="true"))
+    init_default_exchange(db)
+    db.close()
+
+    await burst("per-request commit", lambda i: asyncio.to_thread(register_one, sign_up("old", i)))
+    await burst("group commit", lambda i: registrations.submit(sign_up("new", i)))
+    print(f"group commit used {registrations.batches} transactions for {registrations.registrations} sign-ups")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
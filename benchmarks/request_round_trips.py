@@ -0,0 +1,88 @@
+"""
+Counts the database round trips behind each page and admin action, under
+simulated Neon-like latency. It checks that the count doesn't grow with the
+number of members, which catches N+1 regressions before deploy.
+
+Uses the BENCH_DB_* latency settings if set (see benchmarks/latency.py),
+otherwise 20 ± 5 ms per round trip and 100 ms per new connection.
+"""
+import contextlib
+import io
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+
+import main as app_module  # noqa: E402
+from auth import create_access_token  # noqa: E402
+from benchmarks import latency  # noqa: E402
+from database import SessionLocal  # noqa: E402
+from exchanges import get_or_create_exchange  # noqa: E402
+from models import User  # noqa: E402
+from pairing import create_pairings  # noqa: E402
+
+MEMBER_COUNTS = [10, 500]
+REQUESTS = 3  # Per endpoint; the first may also fill a cache
+ENDPOINTS = [
+    ("GET", "/"),
+    ("GET", "/dashboard"),
+    ("GET", "/admin/stats"),
+    ("POST", "/admin/reshuffle-pairings"),
+]
+
+
+def create_exchange(members: int) -> int:
+    """A fresh exchange with `members` members (the first is its admin), already paired."""
+    db = SessionLocal()
+    exchange_id = get_or_create_exchange(db, f"Round trips {members}").id
+    db.execute(insert(User), [
+        {"first_name": "M", "last_name": str(i), "email": f"m{i}-{members}@example.com", "phone_number": "1",
+         "hashed_password": "x", "is_admin": i == 0, "exchange_id": exchange_id}
+        for i in range(members)
+    ])
+    db.commit()
+    create_pairings(db, exchange_id)
+    admin_id = db.query(User.id).filter(User.email == f"m0-{members}@example.com").scalar()
+    db.close()
+    return admin_id
+
+
+def main():
+    injector = latency.active or latency.LatencyInjector(latency_ms=20, jitter_ms=5, connect_ms=100).install()
+    round_trips = {}
+
+    with TestClient(app_module.app) as client:
+        for members in MEMBER_COUNTS:
+            admin_id = create_exchange(members)
+            client.cookies.set("access_token", create_access_token(data={"sub": str(admin_id)}))
+            print(f"-- {members} members")
+            for method, path in ENDPOINTS:
+                injector.take_counts()
+                start = time.perf_counter()
+                # The app's DEBUG prints would otherwise bury the results
+                with contextlib.redirect_stdout(io.StringIO()):
+                    for _ in range(REQUESTS):
+                        response = client.request(method, path, follow_redirects=False)
+                        assert response.status_code < 400, (path, response.status_code)
+                elapsed = (time.perf_counter() - start) / REQUESTS
+                counts = injector.take_counts()
+                round_trips[(members, path)] = sum(counts.values())
+                detail = ", ".join(f"{count} {kind}" for kind, count in sorted(counts.items()))
+                print(f"{method} {path:<28} {sum(counts.values()) / REQUESTS:5.1f} round trips/request "
+                      f"{elapsed * 1000:8.1f} ms/request  ({detail})")
+
+    smallest, largest = MEMBER_COUNTS[0], MEMBER_COUNTS[-1]
+    for _, path in ENDPOINTS:
+        assert round_trips[(smallest, path)] == round_trips[(largest, path)], (
+            f"{path}: {round_trips[(smallest, path)]} round trips with {smallest} members "
+            f"but {round_trips[(largest, path)]} with {largest}"
+        )
+    print("Round trips per request don't grow with the number of members")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Hold thousands of idle SSE streams open against a real uvicorn server, and
+measure the server's memory per connection. Then publish an event and time how
+long it takes to reach every stream.
+"""
+import asyncio
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks.common import use_scratch_database
+
+use_scratch_database()
+
+from auth import create_access_token  # noqa: E402
+from database import SessionLocal, init_db  # noqa: E402
+from events import PAIRINGS_CREATED, publish_event  # noqa: E402
+from exchanges import DEFAULT_EXCHANGE_SLUG, get_exchange_id, init_default_exchange  # noqa: E402
+from models import User  # noqa: E402
+
+CONNECTIONS = 2000
+CONNECT_BATCH = 100
+HOST = "127.0.0.1"
+PORT = 8765
+
+
+def create_member():
+    """A member to open the streams as. Returns (exchange id, session cookie)."""
+    init_db()
+    db = SessionLocal()
+    init_default_exchange(db)
+    exchange_id = get_exchange_id(db, DEFAULT_EXCHANGE_SLUG)
+    user = User(first_name="S", last_name="SE", email="sse@example.com", phone_number="1",
+                hashed_password="x", is_admin=False, exchange_id=exchange_id)
+    db.add(user)
+    db.commit()
+    token = create_access_token(data={"sub": str(user.id)})
+    db.close()
+    return exchange_id, f"access_token={token}"
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError("VmRSS not found")
+
+
+async def wait_for_server():
+    for _ in range(100):
+        try:
+            _, writer = await asyncio.open_connection(HOST, PORT)
+            writer.close()
+            return
+        except OSError:
+            await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def open_stream(cookie: str):
+    reader, writer = await asyncio.open_connection(HOST, PORT)
+    writer.write(
+        f"GET /events HTTP/1.1\r\nHost: {HOST}\r\nCookie: {cookie}\r\nAccept: text/event-stream\r\n\r\n".encode()
+    )
+    await writer.drain()
+    status = await reader.readline()
+    assert b" 200 " in status, status
+    await reader.readuntil(b"retry: 5000\n\n")
+    return reader, writer
+
+
+async def main():
+    # Each stream is one socket here and one in the server
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, max(soft, CONNECTIONS * 2 + 100)), hard))
+
+    exchange_id, cookie = create_member()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", HOST, "--port", str(PORT), "--log-level", "warning",
+         "--timeout-graceful-shutdown", "1"],
+        # Measure many more streams than a production replica is allowed
+        env={**os.environ, "MAX_SUBSCRIBERS": str(CONNECTIONS)}, stdout=subprocess.DEVNULL,
+    )
+    streams = []
+    try:
+        await wait_for_server()
+        # Warm up imports and the first stream's code paths before measuring
+        reader, writer = await open_stream(cookie)
+        writer.close()
+        await asyncio.sleep(0.5)
+        baseline = rss_bytes(server.pid)
+
+        for _ in range(0, CONNECTIONS, CONNECT_BATCH):
+            streams += await asyncio.gather(*(open_stream(cookie) for _ in range(CONNECT_BATCH)))
+        await asyncio.sleep(0.5)
+        held = rss_bytes(server.pid) - baseline
+        print(f"{len(streams)} idle streams: {held / 1024 / 1024:.2f} MiB server RSS "
+              f"({held / len(streams):.0f} bytes each)")
+
+        db = SessionLocal()
+        start = time.perf_counter()
+        publish_event(db, PAIRINGS_CREATED, exchange_id)
+        db.close()
+        await asyncio.gather(*(reader.readuntil(f"event: {PAIRINGS_CREATED}\n".encode()) for reader, _ in streams))
+        print(f"event reached all {len(streams)} streams in {time.perf_counter() - start:.2f} s "
+              f"(includes up to the poll interval)")
+    finally:
+        for _, writer in streams:
+            writer.close()
+        await asyncio.gather(*(writer.wait_closed() for _, writer in streams), return_exceptions=True)
+        server.terminate()
+        server.wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
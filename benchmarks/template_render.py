@@ -0,0 +1,75 @@
+"""
+Render cost per page: the original per-request Jinja2Templates render vs. the
+compiled environment, the pre-rendered login page, and the dashboard rendered
+whole vs. streamed.
+"""
+from types import SimpleNamespace
+
+from benchmarks.common import use_scratch_database, timed
+
+use_scratch_database()
+
+from fastapi import Request  # noqa: E402
+from fastapi.templating import Jinja2Templates  # noqa: E402
+
+import templating  # noqa: E402
+
+ROSTER_SIZES = [10, 1000, 10000]
+
+
+def fake_user(user_id: int, is_admin: bool = False):
+    return SimpleNamespace(
+        id=user_id,
+        first_name=f"First{user_id}",
+        last_name=f"Last{user_id}",
+        email=f"user{user_id}@example.com",
+        phone_number="555-0100",
+        is_admin=is_admin,
+    )
+
+
+def dashboard_context(roster_size: int):
+    users = [fake_user(i, is_admin=(i == 0)) for i in range(roster_size)]
+    return {
+        "request": None,
+        "user": users[0],
+        "exchange": SimpleNamespace(name="Benchmark Exchange"),
+        "all_users": users,
+        "assigned_person": users[1],
+        "pairings_exist": True,
+        "registration_open": True,
+        "user_pairing_status": {u.id: True for u in users},
+        "error_message": None,
+        "success_message": None,
+    }
+
+
+def main():
+    # What "/" did before: a module-level Jinja2Templates (which caches parsed
+    # templates, but checks the file's mtime on every render) building a response per request
+    original = Jinja2Templates(directory="templates")
+    original.env.globals.update(templating.env.globals)
+    request = Request({"type": "http", "method": "GET", "path": "/", "headers": [], "query_string": b""})
+    original.TemplateResponse(request, "index.html")
+
+    timed("index.html: Jinja2Templates response", lambda: original.TemplateResponse(request, "index.html"), repeat=2000)
+    timed("index.html: compiled template render", lambda: templating.env.get_template("index.html").render({}), repeat=2000)
+
+    page = templating.prerender("index.html")
+    timed("index.html: pre-rendered response", lambda: page.response(request), repeat=20000)
+    print(f"index.html size: {len(page.body)} bytes raw, {len(page.gzipped)} bytes gzip")
+
+    template = templating.env.get_template("dashboard.html")
+    for roster_size in ROSTER_SIZES:
+        context = dashboard_context(roster_size)
+        repeat = max(3, 2000 // roster_size)
+        timed(f"dashboard.html ({roster_size} users): full render", lambda: template.render(context), repeat=repeat)
+        timed(
+            f"dashboard.html ({roster_size} users): first chunk",
+            lambda: next(templating._buffered(template.generate(context))),
+            repeat=repeat,
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -5,6 +5,7 @@ Run this script to create an admin account for the Secret Santa app.
 from database import SessionLocal, init_db
 from models import User
 from auth import get_password_hash
+from exchanges import DEFAULT_EXCHANGE_SLUG, init_default_exchange, get_or_create_exchange
 
 def create_admin():
     """Create an admin user."""
@@ -13,10 +14,16 @@ def create_admin():
     
     db = SessionLocal()
     try:
+        init_default_exchange(db)
+
+        # Each gift exchange has its own admin
+        exchange_name = input("Gift exchange name (leave blank for the default): ").strip()
+        exchange = get_or_create_exchange(db, exchange_name or DEFAULT_EXCHANGE_SLUG)
+
         # Check if admin already exists
-        existing_admin = db.query(User).filter(User.is_admin == True).first()
+        existing_admin = db.query(User).filter(User.is_admin == True, User.exchange_id == exchange.id).first()
         if existing_admin:
-            print(f"Admin user already exists: {existing_admin.email}")
+            print(f"Admin user already exists for {exchange.name}: {existing_admin.email}")
             return
         
         print("Creating admin user...")
@@ -47,12 +54,15 @@ def create_admin():
             phone_number=phone_number,
             hashed_password=hashed_password,
             is_admin=True,
+            exchange_id=exchange.id,
         )
         
         db.add(admin_user)
         db.commit()
         print(f"\n✅ Admin user created successfully!")
         print(f"Email: {email}")
+        if exchange.slug != DEFAULT_EXCHANGE_SLUG:
+            print(f"Members register for this exchange at /?exchange={exchange.slug}")
         # print(f"You can now log in at http://localhost:8000")
         
     except Exception as e:
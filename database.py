@@ -1,5 +1,5 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -50,11 +50,45 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
+# Columns added to tables that already existed in deployed databases.
+# create_all() only creates missing tables, so these are added by hand.
+# (table, column, column DDL, whether the model declares index=True)
+ADDED_COLUMNS = [
+    ("users", "exchange_id", "INTEGER REFERENCES exchanges(id)", True),
+    ("pairings", "exchange_id", "INTEGER REFERENCES exchanges(id)", True),
+    ("users", "created_at", "TIMESTAMP", False),
+]
+
+# Indexes added to columns that already existed: (table, column)
+ADDED_INDEXES = [
+    ("pairings", "receiver_id"),
+]
+
+
+def upgrade_schema():
+    """Add any missing columns and indexes to existing tables."""
+    inspector = inspect(engine)
+    # Checked via the inspector: MySQL has no CREATE INDEX IF NOT EXISTS
+    wanted_indexes = list(ADDED_INDEXES)
+    with engine.begin() as conn:
+        for table, column, ddl, indexed in ADDED_COLUMNS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            if indexed:
+                wanted_indexes.append((table, column))
+        for table, column in wanted_indexes:
+            existing = {index["name"] for index in inspector.get_indexes(table)}
+            if f"ix_{table}_{column}" not in existing:
+                conn.execute(text(f"CREATE INDEX ix_{table}_{column} ON {table} ({column})"))
+
+
 # Create tables
 def init_db():
     # Import models to ensure they're registered with Base
-    from models import User, Settings, Pairing
+    from models import Exchange, User, Settings, Pairing, PairingHistory, Event, RateLimitBucket
     Base.metadata.create_all(bind=engine)
+    upgrade_schema()
 
 
 # Dependency to get DB session
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from database import SessionLocal
+from models import Event
+from pairing_index import invalidate_pairing_index
+from stats import invalidate_stats
+
+# Event kinds pushed to connected dashboards
+PAIRINGS_CREATED = "pairings_created"
+ASSIGNED = "assigned"
+REGISTRATION_OPENED = "registration_opened"
+REGISTRATION_CLOSED = "registration_closed"
+
+# Kinds after which a dashboard reload must see the new pairings
+PAIRING_CHANGES = (PAIRINGS_CREATED, ASSIGNED)
+
+HEARTBEAT_SECONDS = 15      # Comment line sent to idle streams so proxies keep them open
+POLL_SECONDS = 2            # How often each replica checks the events table for new rows
+SUBSCRIBER_QUEUE_SIZE = 8   # Pending events per client; the oldest is dropped when full
+# Open streams per replica. The platform counts each one against replica_concurrency
+# in cerebrium.toml, which has room for these on top of REPLICA_CONCURRENCY
+MAX_SUBSCRIBERS = int(os.getenv("MAX_SUBSCRIBERS", "190"))
+EVENT_RETENTION = 500       # Rows kept in the events table after each publish
+
+
+class Subscriber:
+    """
+    A single connected client and its bounded queue of pending events. It
+    receives only events after `after_id`, the latest one its page had seen.
+    """
+
+    __slots__ = ("user_id", "exchange_id", "after_id", "queue")
+
+    def __init__(self, user_id: int, exchange_id: int, after_id: int):
+        self.user_id = user_id
+        self.exchange_id = exchange_id
+        self.after_id = after_id
+        self.queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+
+
+class Broadcaster:
+    """
+    In-process fan-out of events to the streams connected to this replica.
+    Events are read from the shared events table, so every replica sees
+    what any other replica published.
+    """
+
+    def __init__(self):
+        self.subscribers: Set[Subscriber] = set()
+        self.last_event_id = 0
+        self.dropped = 0
+
+    def subscribe(self, user_id: int, exchange_id: int, after_id: int) -> Optional[Subscriber]:
+        """
+        Register a new stream for events after `after_id`, or return None if the
+        replica is at capacity.
+        """
+        if len(self.subscribers) >= MAX_SUBSCRIBERS:
+            return None
+        # Poll from the oldest point any stream still needs, so events published
+        # between a page render and its stream connecting aren't skipped
+        if self.subscribers:
+            self.last_event_id = min(self.last_event_id, after_id)
+        else:
+            self.last_event_id = after_id
+        subscriber = Subscriber(user_id, exchange_id, after_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        self.subscribers.discard(subscriber)
+
+    def fan_out(self, event: Dict, since: int):
+        """
+        Queue an event, read by a poll for everything after `since`, for every
+        subscriber it targets without ever blocking.
+        """
+        exchange_id = event["data"].get("exchange_id")
+        user_ids = event["data"].get("user_ids")
+        targets = set(user_ids) if user_ids is not None else None
+        for subscriber in self.subscribers:
+            if event["id"] <= subscriber.after_id:
+                continue  # Already seen, re-read because a newer stream needed older events
+            if subscriber.after_id < since:
+                continue  # Subscribed mid-poll and needs older events first; the next poll rewinds
+            subscriber.after_id = event["id"]
+            if subscriber.exchange_id != exchange_id:
+                continue
+            if targets is not None and subscriber.user_id not in targets:
+                continue
+            if subscriber.queue.full():
+                # Slow client: drop its oldest event rather than grow without bound
+                subscriber.queue.get_nowait()
+                self.dropped += 1
+            subscriber.queue.put_nowait(event)
+
+
+broadcaster = Broadcaster()
+
+
+def publish_event(db: Session, kind: str, exchange_id: int, user_ids: Optional[Iterable[int]] = None):
+    """
+    Record an event so every replica pushes it to the exchange's connected clients.
+    If user_ids is given, only those users receive it.
+    """
+    payload = {"exchange_id": exchange_id}
+    if user_ids is not None:
+        payload["user_ids"] = sorted(user_ids)
+    event = Event(kind=kind, payload=json.dumps(payload))
+    db.add(event)
+    db.flush()
+    # Keep the table small - replicas only ever read recent rows
+    db.query(Event).filter(Event.id <= event.id - EVENT_RETENTION).delete(synchronize_session=False)
+    db.commit()
+
+
+def latest_event_id(db: Session) -> int:
+    """The newest event's id; pages record it so their stream picks up from there."""
+    return db.query(func.max(Event.id)).scalar() or 0
+
+
+def _events_since(event_id: int) -> List[Dict]:
+    db = SessionLocal()
+    try:
+        rows = db.query(Event).filter(Event.id > event_id).order_by(Event.id).all()
+        return [{"id": row.id, "kind": row.kind, "data": json.loads(row.payload)} for row in rows]
+    finally:
+        db.close()
+
+
+async def poll_events():
+    """Background task: forward newly published events to local subscribers."""
+    while True:
+        await asyncio.sleep(POLL_SECONDS)
+        # Don't touch the database (or wake a suspended one) when nobody is listening
+        if not broadcaster.subscribers:
+            continue
+        cursor = broadcaster.last_event_id
+        try:
+            events = await asyncio.to_thread(_events_since, cursor)
+        except Exception as e:
+            print(f"Error polling events: {e}")
+            continue
+        for event in events:
+            if event["kind"] in PAIRING_CHANGES:
+                # The reload this event triggers must not be served this replica's
+                # cached index or stats, which could be a few seconds behind
+                invalidate_pairing_index(event["data"]["exchange_id"])
+                invalidate_stats(event["data"]["exchange_id"])
+            broadcaster.fan_out(event, cursor)
+        # A stream that subscribed during the query may have moved the cursor back
+        # to events it still needs; leave it there for the next poll
+        if events and broadcaster.last_event_id == cursor:
+            broadcaster.last_event_id = events[-1]["id"]
+
+
+async def event_stream(request, subscriber: Subscriber):
+    """Yield Server-Sent Events for one client until it disconnects."""
+    try:
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            # Routing fields stay server-side
+            data = {key: value for key, value in event["data"].items() if key not in ("exchange_id", "user_ids")}
+            yield f"id: {event['id']}\nevent: {event['kind']}\ndata: {json.dumps(data)}\n\n"
+    finally:
+        broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,76 @@
+import re
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Exchange, User, Pairing, Settings
+from pairing_history import backfill_history
+
+# Members who register without picking an exchange join this one
+DEFAULT_EXCHANGE_SLUG = "default"
+DEFAULT_EXCHANGE_NAME = "Secret Santa"
+
+# Slugs and ids never change once created, so this cache never goes stale
+_ids_by_slug: Dict[str, int] = {}
+
+
+def slugify(name: str) -> str:
+    """'Youth Ministry 2025' -> 'youth-ministry-2025'"""
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-") or DEFAULT_EXCHANGE_SLUG
+
+
+def init_default_exchange(db: Session):
+    """
+    Create the default exchange if needed and move members and pairings created
+    before exchanges existed into it. Pairings made before the pairing history
+    existed become each exchange's round 1, so the next reshuffle avoids them.
+    """
+    exchange = db.query(Exchange).filter(Exchange.slug == DEFAULT_EXCHANGE_SLUG).first()
+    if not exchange:
+        # Carry over the old global registration switch
+        setting = db.query(Settings).filter(Settings.key == "registration_open").first()
+        exchange = Exchange(
+            slug=DEFAULT_EXCHANGE_SLUG,
+            name=DEFAULT_EXCHANGE_NAME,
+            registration_open=setting.value.lower() == "true" if setting else True,
+        )
+        db.add(exchange)
+        db.flush()
+    db.query(User).filter(User.exchange_id.is_(None)).update(
+        {User.exchange_id: exchange.id}, synchronize_session=False
+    )
+    db.query(Pairing).filter(Pairing.exchange_id.is_(None)).update(
+        {Pairing.exchange_id: exchange.id}, synchronize_session=False
+    )
+    backfill_history(db)
+    db.commit()
+
+
+def get_or_create_exchange(db: Session, name: str) -> Exchange:
+    """Look up an exchange by name, creating it if it doesn't exist."""
+    slug = slugify(name)
+    exchange = db.query(Exchange).filter(Exchange.slug == slug).first()
+    if not exchange:
+        exchange = Exchange(slug=slug, name=name, registration_open=True)
+        db.add(exchange)
+        db.commit()
+    return exchange
+
+
+def get_exchange_id(db: Session, slug: str) -> Optional[int]:
+    """Resolve an exchange slug to its id, or None if there's no such exchange."""
+    if slug not in _ids_by_slug:
+        exchange_id = db.query(Exchange.id).filter(Exchange.slug == slug).scalar()
+        if exchange_id is None:
+            return None
+        _ids_by_slug[slug] = exchange_id
+    return _ids_by_slug[slug]
+
+
+def get_exchange_for_registration(db: Session, slug: str) -> Optional[Tuple[int, bool]]:
+    """
+    An exchange's id and whether it's open for registration, or None if there's
+    no such exchange. The open flag can change, so unlike ids it isn't cached.
+    """
+    row = db.query(Exchange.id, Exchange.registration_open).filter(Exchange.slug == slug).first()
+    return (row.id, row.registration_open) if row else None
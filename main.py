@@ -1,36 +1,65 @@
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import asyncio
+from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import Response
 import os
 
 from database import init_db, SessionLocal
-from models import Settings
 from routers import users, admin
+from events import poll_events
+from templating import compile_templates
+from assets import static_assets
+from exchanges import init_default_exchange
+from profiler import ProfilerMiddleware
+from admission import AdmissionMiddleware
 
 # Initialize FastAPI app
 app = FastAPI(title="Secret Santa App")
 
+# Per-route-class concurrency limits: shed work that can't start in time with a 503
+app.add_middleware(AdmissionMiddleware)
+
+# Admin-requested (X-Profile: 1 or ?profile=1) and sampled background request profiling.
+# Added last so it runs first and profiles include time spent queued for admission.
+app.add_middleware(ProfilerMiddleware)
+
 # Initialize database
 init_db()
 
-# Initialize default settings
-def init_settings():
-    """Initialize default settings if they don't exist."""
+# Initialize the default exchange
+def init_exchanges():
+    """Create the default exchange and move any members from before exchanges existed into it."""
     db = SessionLocal()
     try:
-        registration_setting = db.query(Settings).filter(Settings.key == "registration_open").first()
-        if not registration_setting:
-            registration_setting = Settings(key="registration_open", value="true")
-            db.add(registration_setting)
-            db.commit()
+        init_default_exchange(db)
     finally:
         db.close()
 
-# Initialize settings on startup
-init_settings()
+# Initialize exchanges on startup
+init_exchanges()
+
+# Compile all templates before the first request
+compile_templates()
+
+
+@app.on_event("startup")
+async def start_event_poller():
+    """Forward events published by any replica to this replica's SSE clients."""
+    app.state.event_poller = asyncio.create_task(poll_events())
+
+
+@app.api_route("/static/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+async def static(request: Request, path: str):
+    """Serve static files from memory, precompressed; fingerprinted names are cached forever."""
+    response = static_assets.response(request, path)
+    if response is None:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return response
+
 
-# Mount static files
-os.makedirs("static", exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+@app.get("/healthz", include_in_schema=False)
+async def healthz():
+    """Health and readiness check. Does no database or template work."""
+    return Response(b"ok", media_type="text/plain")
 
 # Include routers
 app.include_router(users.router)
@@ -1,8 +1,20 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey
+from datetime import datetime
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, Float, Index, DateTime
 from sqlalchemy.orm import relationship
 from database import Base
 
 
+class Exchange(Base):
+    """A gift exchange (e.g. one department's). Members, pairings and per-exchange settings belong to one."""
+    __tablename__ = "exchanges"
+
+    id = Column(Integer, primary_key=True, index=True)
+    slug = Column(String, unique=True, index=True, nullable=False)
+    name = Column(String, nullable=False)
+    registration_open = Column(Boolean, nullable=False, default=True)
+    pairing_version = Column(Integer, nullable=False, default=0)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -13,6 +25,8 @@ class User(Base):
     phone_number = Column(String, nullable=False)
     hashed_password = Column(String, nullable=False)
     is_admin = Column(Boolean, default=False)
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     gifter_pairings = relationship("Pairing", foreign_keys="Pairing.gifter_id", back_populates="gifter")
@@ -32,9 +46,43 @@ class Pairing(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     gifter_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True)
-    receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), index=True)
 
     # Relationships
     gifter = relationship("User", foreign_keys=[gifter_id], back_populates="gifter_pairings")
     receiver = relationship("User", foreign_keys=[receiver_id], back_populates="receiver_pairings")
 
+
+class PairingHistory(Base):
+    """Append-only record of every assignment, one round per reshuffle."""
+    __tablename__ = "pairing_history"
+
+    id = Column(Integer, primary_key=True)
+    exchange_id = Column(Integer, ForeignKey("exchanges.id"), nullable=False)
+    round = Column(Integer, nullable=False)
+    gifter_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    receiver_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+
+    __table_args__ = (
+        # "Was A -> B used in the last K rounds?"
+        Index("ix_pairing_history_match", "exchange_id", "gifter_id", "receiver_id", "round"),
+        # Latest round, and every match from the last K rounds in one range scan
+        Index("ix_pairing_history_round", "exchange_id", "round"),
+    )
+
+
+class Event(Base):
+    __tablename__ = "events"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String, nullable=False)
+    payload = Column(Text, nullable=False, default="{}")
+
+
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(Float, nullable=False, index=True)
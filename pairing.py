@@ -1,34 +1,84 @@
 import random
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from models import User, Pairing
-from typing import List, Dict
+from models import Exchange, User, Pairing
+from pairing_index import invalidate_pairing_index
+from stats import invalidate_stats
+from pairing_history import (
+    AVOID_RECENT_ROUNDS,
+    latest_round,
+    load_recent_matches,
+    match_key,
+    record_pairings,
+)
+from typing import List, Dict, Set, Tuple
 
+# Reshuffles tried when looking for a gift circle with no recent matches
+MAX_SHUFFLE_ATTEMPTS = 200
 
-def create_pairings(db: Session) -> Dict[str, any]:
+
+def bump_pairing_version(db: Session, exchange_id: int):
+    """Record that an exchange's pairings changed so every replica reloads its pairing index."""
+    db.query(Exchange).filter(Exchange.id == exchange_id).update(
+        {Exchange.pairing_version: Exchange.pairing_version + 1},
+        synchronize_session=False,
+    )
+    invalidate_pairing_index(exchange_id)
+    invalidate_stats(exchange_id)
+
+
+def shuffle_circle(user_ids: List[int], recent_matches: Set[int]) -> Tuple[List[int], int]:
+    """
+    Shuffle members into a gift circle (each gives to the next), reshuffling
+    to avoid matches in recent_matches. Returns the order with the fewest
+    repeats and how many it has.
     """
-    Create Secret Santa pairings for all users.
-    Ensures one-to-one mapping with no self-assignments.
+    count = len(user_ids)
+    best_order, best_repeats = None, None
+    for _ in range(MAX_SHUFFLE_ATTEMPTS):
+        random.shuffle(user_ids)
+        repeats = 0
+        if recent_matches:
+            repeats = sum(
+                1 for i in range(count)
+                if match_key(user_ids[i], user_ids[(i + 1) % count]) in recent_matches
+            )
+        if best_order is None or repeats < best_repeats:
+            best_order, best_repeats = list(user_ids), repeats
+        if repeats == 0:
+            break
+    return best_order, best_repeats
+
+
+def create_pairings(db: Session, exchange_id: int, avoid_recent_rounds: int = AVOID_RECENT_ROUNDS) -> Dict[str, any]:
+    """
+    Create Secret Santa pairings for all members of an exchange.
+    Ensures one-to-one mapping with no self-assignments, and avoids repeating
+    matches from the last `avoid_recent_rounds` rounds where possible.
+    Each call starts a new round in the pairing history.
     Returns a dict with success status and message.
     Requires at least 2 users to create pairings.
     """
-    # Get all users
-    users = db.query(User).all()
+    # Get all user IDs - plain ids survive the commit below, whereas expired
+    # User objects would be reloaded with one query per member
+    user_ids = [user_id for (user_id,) in db.query(User.id).filter(User.exchange_id == exchange_id)]
     
-    if len(users) < 2:
+    if len(user_ids) < 2:
         return {"success": False, "message": "Need at least 2 members to create pairings"}
     
+    # Matches to avoid, loaded from the history in one query
+    recent_matches = load_recent_matches(db, exchange_id, avoid_recent_rounds)
+    new_round = latest_round(db, exchange_id) + 1
+    
     # Clear existing pairings
-    db.query(Pairing).delete()
+    db.query(Pairing).filter(Pairing.exchange_id == exchange_id).delete()
     db.commit()
     
-    # Create a list of user IDs
-    user_ids = [user.id for user in users]
-    
-    # Shuffle to randomize
-    random.shuffle(user_ids)
+    # Shuffle to randomize, steering clear of recent matches
+    user_ids, repeats = shuffle_circle(user_ids, recent_matches)
     
     # Create pairings: each user gives to the next one, last gives to first
-    pairings = []
+    pairs = []
     for i in range(len(user_ids)):
         gifter_id = user_ids[i]
         receiver_id = user_ids[(i + 1) % len(user_ids)]  # Circular assignment
@@ -36,47 +86,61 @@ def create_pairings(db: Session) -> Dict[str, any]:
         # Double-check no self-assignment (shouldn't happen with this logic, but safety check)
         if gifter_id == receiver_id:
             # This should never happen, but if it does, reshuffle
-            return create_pairings(db)
+            return create_pairings(db, exchange_id, avoid_recent_rounds)
         
-        pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id)
-        pairings.append(pairing)
-        db.add(pairing)
+        pairs.append((gifter_id, receiver_id))
+    
+    message = f"Successfully created {len(pairs)} pairings"
+    if repeats:
+        message += f" ({repeats} repeat a recent match - not enough members to avoid them all)"
     
     try:
+        # One multi-row insert rather than an INSERT per pairing
+        db.execute(insert(Pairing), [
+            {"gifter_id": gifter_id, "receiver_id": receiver_id, "exchange_id": exchange_id}
+            for gifter_id, receiver_id in pairs
+        ])
+        record_pairings(db, exchange_id, new_round, pairs)
+        bump_pairing_version(db, exchange_id)
         db.commit()
-        return {"success": True, "message": f"Successfully created {len(pairings)} pairings"}
+        return {"success": True, "message": message}
     except Exception as e:
         db.rollback()
         return {"success": False, "message": f"Error creating pairings: {str(e)}"}
 
 
+def current_round(db: Session, exchange_id: int) -> int:
+    """The round late additions are recorded under (the first one if there's no history yet)."""
+    return max(latest_round(db, exchange_id), 1)
+
+
 def get_user_pairing(db: Session, user_id: int) -> Pairing:
     """Get the pairing for a specific user (who they are gifting to)."""
     return db.query(Pairing).filter(Pairing.gifter_id == user_id).first()
 
 
-def get_all_pairings(db: Session) -> List[Pairing]:
+def get_all_pairings(db: Session, exchange_id: int) -> List[Pairing]:
     """Get all pairings (admin only)."""
-    return db.query(Pairing).all()
+    return db.query(Pairing).filter(Pairing.exchange_id == exchange_id).all()
 
 
-def pairing_exists(db: Session) -> bool:
+def pairing_exists(db: Session, exchange_id: int) -> bool:
     """Check if pairings have been created."""
-    return db.query(Pairing).count() > 0
+    return db.query(Pairing).filter(Pairing.exchange_id == exchange_id).count() > 0
 
 
-def assign_new_user(db: Session, new_user_id: int) -> Dict[str, any]:
+def assign_new_user(db: Session, exchange_id: int, new_user_id: int) -> Dict[str, any]:
     """
     Assign a newly registered user to the pairing system without disrupting existing pairings.
     This allows late registrations without reshuffling existing assignments.
     """
     # Check if pairings exist
-    existing_pairings = db.query(Pairing).all()
+    existing_pairings = db.query(Pairing).filter(Pairing.exchange_id == exchange_id).all()
     if not existing_pairings:
         return {"success": False, "message": "No existing pairings found. Admin must create initial pairings first."}
     
     # Get all users
-    all_users = db.query(User).all()
+    all_users = db.query(User).filter(User.exchange_id == exchange_id).all()
     all_user_ids = {user.id for user in all_users}
     
     # Get users who already have pairings (as gifter)
@@ -110,12 +174,18 @@ def assign_new_user(db: Session, new_user_id: int) -> Dict[str, any]:
         # 1. Old gifter now gifts to new user
         # 2. New user gifts to old receiver
         pairing_to_modify.receiver_id = new_user_id
-        new_pairing = Pairing(gifter_id=new_user_id, receiver_id=old_receiver)
+        new_pairing = Pairing(gifter_id=new_user_id, receiver_id=old_receiver, exchange_id=exchange_id)
         db.add(new_pairing)
+        record_pairings(db, exchange_id, current_round(db, exchange_id), [(old_gifter, new_user_id), (new_user_id, old_receiver)])
         
         try:
+            bump_pairing_version(db, exchange_id)
             db.commit()
-            return {"success": True, "message": f"New user inserted into pairing chain between users {old_gifter} and {old_receiver}"}
+            return {
+                "success": True,
+                "message": f"New user inserted into pairing chain between users {old_gifter} and {old_receiver}",
+                "assigned_user_ids": [new_user_id, old_gifter],
+            }
         except Exception as e:
             db.rollback()
             return {"success": False, "message": f"Error assigning new user: {str(e)}"}
@@ -125,52 +195,58 @@ def assign_new_user(db: Session, new_user_id: int) -> Dict[str, any]:
         import random
         selected_receiver = random.choice(list(available_receivers))
         
-        new_pairing = Pairing(gifter_id=new_user_id, receiver_id=selected_receiver)
+        new_pairing = Pairing(gifter_id=new_user_id, receiver_id=selected_receiver, exchange_id=exchange_id)
         db.add(new_pairing)
+        record_pairings(db, exchange_id, current_round(db, exchange_id), [(new_user_id, selected_receiver)])
         
         try:
+            bump_pairing_version(db, exchange_id)
             db.commit()
-            return {"success": True, "message": f"New user assigned to gift user ID {selected_receiver}"}
+            return {
+                "success": True,
+                "message": f"New user assigned to gift user ID {selected_receiver}",
+                "assigned_user_ids": [new_user_id],
+            }
         except Exception as e:
             db.rollback()
             return {"success": False, "message": f"Error assigning new user: {str(e)}"}
 
 
-def get_users_without_gifters(db: Session) -> List[int]:
+def get_users_without_gifters(db: Session, exchange_id: int) -> List[int]:
     """Get list of user IDs who don't have anyone gifting to them."""
-    all_users = db.query(User).all()
+    all_users = db.query(User).filter(User.exchange_id == exchange_id).all()
     all_user_ids = {user.id for user in all_users}
     
-    existing_pairings = db.query(Pairing).all()
+    existing_pairings = db.query(Pairing).filter(Pairing.exchange_id == exchange_id).all()
     users_with_gifters = {pairing.receiver_id for pairing in existing_pairings}
     
     return list(all_user_ids - users_with_gifters)
 
 
-def reshuffle_all_pairings(db: Session) -> Dict[str, any]:
+def reshuffle_all_pairings(db: Session, exchange_id: int) -> Dict[str, any]:
     """
     Reshuffle all pairings - clears existing pairings and creates new ones for all users.
     This will reassign everyone, including those who already had pairs.
     """
     # This is essentially the same as create_pairings, but with a clearer name
-    return create_pairings(db)
+    return create_pairings(db, exchange_id)
 
 
-def assign_users_without_pairs(db: Session) -> Dict[str, any]:
+def assign_users_without_pairs(db: Session, exchange_id: int) -> Dict[str, any]:
     """
     Assign pairings only for users who don't have pairs yet.
     Users with existing pairs will not be affected.
     Requires at least 2 unpaired members to create pairings.
     """
     # Get all users
-    all_users = db.query(User).all()
+    all_users = db.query(User).filter(User.exchange_id == exchange_id).all()
     all_user_ids = {user.id for user in all_users}
     
     if len(all_user_ids) < 2:
         return {"success": False, "message": "Need at least 2 users to create pairings"}
     
     # Get existing pairings
-    existing_pairings = db.query(Pairing).all()
+    existing_pairings = db.query(Pairing).filter(Pairing.exchange_id == exchange_id).all()
     users_with_pairings = {pairing.gifter_id for pairing in existing_pairings}
     
     # Find users without pairings
@@ -190,12 +266,14 @@ def assign_users_without_pairs(db: Session) -> Dict[str, any]:
         gifter_id = users_list[0]
         receiver_id = users_list[1]
         
-        new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id)
+        new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id, exchange_id=exchange_id)
         db.add(new_pairing)
+        record_pairings(db, exchange_id, current_round(db, exchange_id), [(gifter_id, receiver_id)])
         
         try:
+            bump_pairing_version(db, exchange_id)
             db.commit()
-            return {"success": True, "message": f"Successfully paired 2 unpaired members"}
+            return {"success": True, "message": f"Successfully paired 2 unpaired members", "assigned_user_ids": [gifter_id]}
         except Exception as e:
             db.rollback()
             return {"success": False, "message": f"Error creating pairing: {str(e)}"}
@@ -223,7 +301,7 @@ def assign_users_without_pairs(db: Session) -> Dict[str, any]:
             receiver_id = random.choice(list(available_receivers))
             available_receivers.remove(receiver_id)
             
-            new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id)
+            new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id, exchange_id=exchange_id)
             db.add(new_pairing)
             new_pairings.append(new_pairing)
             assigned_gifters.add(gifter_id)
@@ -237,20 +315,30 @@ def assign_users_without_pairs(db: Session) -> Dict[str, any]:
         for i in range(len(remaining_list)):
             gifter_id = remaining_list[i]
             receiver_id = remaining_list[(i + 1) % len(remaining_list)]
-            new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id)
+            new_pairing = Pairing(gifter_id=gifter_id, receiver_id=receiver_id, exchange_id=exchange_id)
             db.add(new_pairing)
             new_pairings.append(new_pairing)
+            assigned_gifters.add(gifter_id)
             assigned_count += 1
     elif len(remaining_unassigned) == 1:
         # One remaining user - insert into existing chain
         new_user_id = list(remaining_unassigned)[0]
-        result = assign_new_user(db, new_user_id)
+        result = assign_new_user(db, exchange_id, new_user_id)
         if result["success"]:
+            assigned_gifters.update(result.get("assigned_user_ids", []))
             assigned_count += 1
     
+    # Late additions join the current round of the history
+    record_pairings(db, exchange_id, current_round(db, exchange_id), [(p.gifter_id, p.receiver_id) for p in new_pairings])
+    
     try:
+        bump_pairing_version(db, exchange_id)
         db.commit()
-        return {"success": True, "message": f"Successfully assigned {assigned_count} users without disrupting existing pairings"}
+        return {
+            "success": True,
+            "message": f"Successfully assigned {assigned_count} users without disrupting existing pairings",
+            "assigned_user_ids": sorted(assigned_gifters),
+        }
     except Exception as e:
         db.rollback()
         return {"success": False, "message": f"Error assigning users: {str(e)}"}
@@ -0,0 +1,78 @@
+from typing import Iterable, Set, Tuple
+
+from sqlalchemy import func, insert, literal, select
+from sqlalchemy.orm import Session
+
+from models import Pairing, PairingHistory
+
+# Reshuffles avoid repeating any giver -> receiver match from this many previous rounds
+AVOID_RECENT_ROUNDS = 1
+
+
+def match_key(gifter_id: int, receiver_id: int) -> int:
+    """Pack a gifter -> receiver match into one int for compact set membership."""
+    return (gifter_id << 32) | receiver_id
+
+
+def latest_round(db: Session, exchange_id: int) -> int:
+    """The exchange's most recent round, or 0 if it has never been paired."""
+    return db.query(func.max(PairingHistory.round)).filter(PairingHistory.exchange_id == exchange_id).scalar() or 0
+
+
+def record_pairings(db: Session, exchange_id: int, round: int, pairs: Iterable[Tuple[int, int]]):
+    """Append matches to the history in one multi-row insert. The caller commits."""
+    rows = [
+        {"exchange_id": exchange_id, "round": round, "gifter_id": gifter_id, "receiver_id": receiver_id}
+        for gifter_id, receiver_id in pairs
+    ]
+    if rows:
+        db.execute(insert(PairingHistory), rows)
+
+
+def backfill_history(db: Session):
+    """
+    Copy current pairings into round 1 for exchanges with no history yet, i.e.
+    pairings made before the history existed. One INSERT ... SELECT. The caller commits.
+    """
+    has_history = select(PairingHistory.id).where(PairingHistory.exchange_id == Pairing.exchange_id).exists()
+    current = select(Pairing.exchange_id, literal(1), Pairing.gifter_id, Pairing.receiver_id).where(
+        Pairing.exchange_id.is_not(None), ~has_history
+    )
+    db.execute(
+        insert(PairingHistory).from_select(
+            ["exchange_id", "round", "gifter_id", "receiver_id"], current
+        )
+    )
+
+
+def load_recent_matches(db: Session, exchange_id: int, rounds: int = AVOID_RECENT_ROUNDS) -> Set[int]:
+    """
+    Every match from the exchange's last `rounds` rounds as a set of match_key()s,
+    loaded with a single query.
+    """
+    if rounds <= 0:
+        return set()
+    latest = (
+        db.query(func.max(PairingHistory.round))
+        .filter(PairingHistory.exchange_id == exchange_id)
+        .scalar_subquery()
+    )
+    rows = db.query(PairingHistory.gifter_id, PairingHistory.receiver_id).filter(
+        PairingHistory.exchange_id == exchange_id,
+        PairingHistory.round > latest - rounds,
+    )
+    return {match_key(gifter_id, receiver_id) for gifter_id, receiver_id in rows}
+
+
+def was_matched_recently(db: Session, exchange_id: int, gifter_id: int, receiver_id: int,
+                         rounds: int = AVOID_RECENT_ROUNDS) -> bool:
+    """Single-pair check: was gifter -> receiver used in the last `rounds` rounds?"""
+    latest = latest_round(db, exchange_id)
+    return db.query(
+        db.query(PairingHistory.id).filter(
+            PairingHistory.exchange_id == exchange_id,
+            PairingHistory.gifter_id == gifter_id,
+            PairingHistory.receiver_id == receiver_id,
+            PairingHistory.round > latest - rounds,
+        ).exists()
+    ).scalar()
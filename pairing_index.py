@@ -0,0 +1,134 @@
+import time
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Exchange, User, Pairing
+
+VERSION_CHECK_SECONDS = 5  # How stale another replica's pairing changes can be here
+
+FIELD_SEPARATOR = "\x1f"
+
+
+class Assignment:
+    """The receiver a member is gifting to, with the fields the dashboard shows."""
+
+    __slots__ = ("id", "first_name", "last_name", "email", "phone_number")
+
+    def __init__(self, id: int, first_name: str, last_name: str, email: str, phone_number: str):
+        self.id = id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.email = email
+        self.phone_number = phone_number
+
+
+class PairingIndex:
+    """
+    Read-only gifter -> receiver map for one exchange, held in flat arrays.
+    User ids are global, so each member in the exchange gets a dense slot: its
+    position in a sorted id array, found by binary search. Receiver display
+    fields are packed into one UTF-8 blob addressed by offset, so a lookup is a
+    bisect, a couple of array reads and a slice.
+    """
+
+    def __init__(self, version: int, rows: Iterable[Tuple[int, int, str, str, str, str]]):
+        rows = list(rows)
+        self.ids = array("i", sorted({user_id for row in rows for user_id in row[:2]}))
+        slots = {user_id: slot for slot, user_id in enumerate(self.ids)}
+        size = len(self.ids)
+
+        self.version = version
+        self.count = len(rows)
+        self.receiver_slot = array("i", [-1]) * size  # -1 = no pairing
+        self.profile_start = array("I", bytes(4 * size))
+        self.profile_length = array("I", bytes(4 * size))
+
+        blob = bytearray()
+        for gifter_id, receiver_id, *fields in rows:
+            slot = slots[receiver_id]
+            self.receiver_slot[slots[gifter_id]] = slot
+            if self.profile_length[slot]:
+                continue
+            encoded = FIELD_SEPARATOR.join(fields).encode("utf-8")
+            self.profile_start[slot] = len(blob)
+            self.profile_length[slot] = len(encoded)
+            blob += encoded
+        self.profiles = bytes(blob)
+
+    def _receiver_slot(self, gifter_id: int) -> int:
+        slot = bisect_left(self.ids, gifter_id)
+        if slot < len(self.ids) and self.ids[slot] == gifter_id:
+            return self.receiver_slot[slot]
+        return -1
+
+    def has_pairing(self, user_id: int) -> bool:
+        return self._receiver_slot(user_id) >= 0
+
+    def lookup(self, gifter_id: int) -> Optional[Assignment]:
+        """Who this member is gifting to, or None."""
+        slot = self._receiver_slot(gifter_id)
+        if slot < 0:
+            return None
+        start = self.profile_start[slot]
+        fields = self.profiles[start:start + self.profile_length[slot]].decode("utf-8")
+        return Assignment(self.ids[slot], *fields.split(FIELD_SEPARATOR))
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the index."""
+        arrays = (self.ids, self.receiver_slot, self.profile_start, self.profile_length)
+        return sum(a.itemsize * len(a) for a in arrays) + len(self.profiles)
+
+
+def get_pairing_version(db: Session, exchange_id: int) -> int:
+    return db.query(Exchange.pairing_version).filter(Exchange.id == exchange_id).scalar() or 0
+
+
+def load_pairing_index(db: Session, exchange_id: int, version: int) -> PairingIndex:
+    """Build an exchange's index from a single join of its pairings and receivers."""
+    rows = (
+        db.query(
+            Pairing.gifter_id,
+            Pairing.receiver_id,
+            User.first_name,
+            User.last_name,
+            User.email,
+            User.phone_number,
+        )
+        .join(User, User.id == Pairing.receiver_id)
+        .filter(Pairing.exchange_id == exchange_id)
+        .all()
+    )
+    return PairingIndex(version, rows)
+
+
+# exchange_id -> (index, monotonic time its version was last checked)
+_indexes: Dict[int, Tuple[PairingIndex, float]] = {}
+
+
+def get_pairing_index(db: Session, exchange_id: int) -> PairingIndex:
+    """
+    This replica's index for an exchange. The exchange's pairing version is
+    checked at most every VERSION_CHECK_SECONDS, and the index is rebuilt and
+    swapped in only when it changed.
+    """
+    now = time.monotonic()
+    cached = _indexes.get(exchange_id)
+    if cached is not None and now - cached[1] < VERSION_CHECK_SECONDS:
+        return cached[0]
+
+    version = get_pairing_version(db, exchange_id)
+    index = cached[0] if cached is not None else None
+    if index is None or index.version != version:
+        index = load_pairing_index(db, exchange_id, version)
+    _indexes[exchange_id] = (index, now)
+    return index
+
+
+def invalidate_pairing_index(exchange_id: int):
+    """Force the next lookup on this replica to re-check the exchange's pairing version."""
+    cached = _indexes.get(exchange_id)
+    if cached is not None:
+        _indexes[exchange_id] = (cached[0], float("-inf"))
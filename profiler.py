@@ -0,0 +1,334 @@
+import asyncio
+import contextvars
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from collections import Counter, deque
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+from fastapi import Request
+from sqlalchemy import event
+from starlette.datastructures import MutableHeaders
+
+from database import engine, SessionLocal
+from routers.users import get_current_user
+
+# Admins profile a request by sending `X-Profile: 1` or adding `?profile=1`
+PROFILE_HEADER = b"x-profile"
+PROFILE_QUERY_PARAM = "profile"
+
+# Fraction of all requests profiled in the background, e.g. 0.001 = 1 in 1000 (0 = off)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+SAMPLE_INTERVAL_SECONDS = 0.001  # Between stack samples of a profiled request
+MAX_PROFILE_SECONDS = 30         # Sampling stops after this long (e.g. for /events streams)
+MAX_STACK_DEPTH = 100
+MAX_SQL_LENGTH = 500
+MAX_REPORTS = 50                 # Most recent reports kept on this replica for download
+
+ON_DEMAND = "on-demand"
+BACKGROUND = "background"
+
+# Pseudo-frames for samples taken while the request wasn't running on the event loop
+IDLE = "<idle: awaiting I/O or a worker thread>"
+BUSY = "<event loop busy with other requests>"
+
+# Path prefixes trimmed from frame names: installed packages, the standard library, this app
+PATH_PREFIXES = ("site-packages" + os.sep, os.path.dirname(os.__file__) + os.sep, os.getcwd() + os.sep)
+
+_current: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("profile", default=None)
+_ids = itertools.count(1)
+
+
+class Profile:
+    """Stack samples and SQL timeline for one request."""
+
+    def __init__(self, method: str, path: str, trigger: str, admin_email: Optional[str] = None):
+        self.id = next(_ids)
+        self.method = method
+        self.path = path
+        self.trigger = trigger
+        self.admin_email = admin_email
+        self.status_code: Optional[int] = None
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.last_sample = self.start
+        self.end: Optional[float] = None
+        self.truncated = False
+
+        # The request's own tasks, so samples of other requests on the loop aren't counted
+        self.loop = asyncio.get_running_loop()
+        self.thread_id = threading.get_ident()
+        self.tasks = weakref.WeakSet([asyncio.current_task()])
+
+        # stack (root -> leaf) -> seconds of wall time
+        self.stacks: Counter = Counter()
+        # (offset from start, duration, statement), in seconds
+        self.queries: List[Tuple[float, float, str]] = []
+
+    @property
+    def wall_seconds(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def summary(self) -> Dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status_code": self.status_code,
+            "trigger": self.trigger,
+            "admin": self.admin_email,
+            "started_at": self.started_at,
+            "wall_ms": round(self.wall_seconds * 1000, 3),
+            "sql_ms": round(sum(duration for _, duration, _ in self.queries) * 1000, 3),
+            "queries": len(self.queries),
+            "truncated": self.truncated,
+        }
+
+
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    for marker in PATH_PREFIXES:
+        if marker in filename:
+            filename = filename.split(marker, 1)[1]
+            break
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def _stack(frame) -> Tuple[str, ...]:
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame.f_code))
+        frame = frame.f_back
+    return tuple(reversed(names))
+
+
+class Profiler:
+    """
+    Samples the event loop thread of every profiled request from one background
+    thread, and times their SQL statements. Nothing is hooked in while no request
+    is being profiled.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active: List[Profile] = []
+        self.reports: deque = deque(maxlen=MAX_REPORTS)
+        self.sampler: Optional[threading.Thread] = None
+        self.patched_loops: Dict[asyncio.AbstractEventLoop, object] = {}
+
+    def start(self, profile: Profile):
+        with self.lock:
+            if not self.active:
+                event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+                event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+            self.active.append(profile)
+            if profile.loop not in self.patched_loops:
+                self.patched_loops[profile.loop] = profile.loop.get_task_factory()
+                profile.loop.set_task_factory(self._task_factory)
+            if self.sampler is None:
+                self.sampler = threading.Thread(target=self._sample, name="profiler", daemon=True)
+                self.sampler.start()
+
+    def stop(self, profile: Profile):
+        self._finish(profile)
+        with self.lock:
+            if profile not in self.active:
+                return
+            self.active.remove(profile)
+            if not any(p.loop is profile.loop for p in self.active):
+                profile.loop.set_task_factory(self.patched_loops.pop(profile.loop))
+            if not self.active:
+                event.remove(engine, "before_cursor_execute", _before_cursor_execute)
+                event.remove(engine, "after_cursor_execute", _after_cursor_execute)
+
+    def _finish(self, profile: Profile):
+        """Stop sampling a profile and keep its report. Safe to call more than once."""
+        with self.lock:
+            if profile.end is not None:
+                return
+            profile.end = time.perf_counter()
+            self.reports.append(profile)
+
+    def _task_factory(self, loop, coro, **kwargs):
+        """Tasks a profiled request starts (e.g. to stream its response) belong to its profile."""
+        previous = self.patched_loops.get(loop)
+        task = previous(loop, coro, **kwargs) if previous else asyncio.Task(coro, loop=loop, **kwargs)
+        context = kwargs.get("context")
+        profile = context.get(_current) if context is not None else _current.get()
+        if profile is not None:
+            profile.tasks.add(task)
+        return task
+
+    def _sample(self):
+        while True:
+            with self.lock:
+                profiles = [p for p in self.active if p.end is None]
+                if not self.active:
+                    self.sampler = None
+                    return
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            for profile in profiles:
+                task = asyncio.current_task(profile.loop)
+                if profile.end is not None:
+                    continue  # Finished since the list was taken; its report may be read now
+                if task is None:
+                    stack = (IDLE,)
+                elif task in profile.tasks:
+                    stack = _stack(frames.get(profile.thread_id)) or (IDLE,)
+                else:
+                    stack = (BUSY,)
+                # Weight by elapsed time: the GIL can delay a sample well past the interval
+                profile.stacks[stack] += now - profile.last_sample
+                profile.last_sample = now
+                if now - profile.start > MAX_PROFILE_SECONDS:
+                    profile.truncated = True
+                    self._finish(profile)
+                    # Unhook now rather than when the request ends, which for an
+                    # /events stream can be hours away. On the loop's own thread,
+                    # like every other change to its task factory
+                    try:
+                        profile.loop.call_soon_threadsafe(self.stop, profile)
+                    except RuntimeError:
+                        pass  # Loop already closed
+            del frames
+            time.sleep(SAMPLE_INTERVAL_SECONDS if profiles else 0.1)
+
+    def get_report(self, profile_id: int) -> Optional[Profile]:
+        return next((p for p in self.reports if p.id == profile_id), None)
+
+    def get_metrics(self) -> Dict:
+        """Recent profiles for the admin profiles endpoint, newest first."""
+        return {
+            "sample_rate": PROFILE_SAMPLE_RATE,
+            "active": len(self.active),
+            "profiles": [p.summary() for p in reversed(self.reports)],
+        }
+
+
+profiler = Profiler()
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None:
+        context._profile_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    profile = _current.get()
+    started = getattr(context, "_profile_started", None)
+    if profile is not None and started is not None and profile.end is None:
+        duration = time.perf_counter() - started
+        profile.queries.append((started - profile.start, duration, " ".join(statement.split())[:MAX_SQL_LENGTH]))
+
+
+def format_report(profile: Profile) -> str:
+    """Human-readable report: hot functions by wall time, then the SQL timeline."""
+    total = sum(profile.stacks.values()) or 1e-9
+    inclusive: Counter = Counter()
+    own: Counter = Counter()
+    for stack, seconds in profile.stacks.items():
+        for name in set(stack):
+            inclusive[name] += seconds
+        own[stack[-1]] += seconds
+
+    summary = profile.summary()
+    lines = [
+        f"Profile {profile.id}: {profile.method} {profile.path} -> {profile.status_code}",
+        f"{summary['wall_ms']:.1f} ms wall, {summary['queries']} SQL statements taking {summary['sql_ms']:.1f} ms"
+        f" ({profile.trigger}{', by ' + profile.admin_email if profile.admin_email else ''})",
+    ]
+    if profile.truncated:
+        lines.append(f"Sampling stopped after {MAX_PROFILE_SECONDS} s")
+
+    lines += ["", "Self time (where wall time was spent)", f"{'ms':>10} {'%':>6}  function"]
+    for name, seconds in own.most_common(25):
+        lines.append(f"{seconds * 1000:10.1f} {seconds / total * 100:6.1f}  {name}")
+
+    lines += ["", "Inclusive time (>= 1% of wall time)", f"{'ms':>10} {'%':>6}  function"]
+    for name, seconds in inclusive.most_common(60):
+        if seconds / total < 0.01:
+            break
+        lines.append(f"{seconds * 1000:10.1f} {seconds / total * 100:6.1f}  {name}")
+
+    lines += ["", "SQL timeline", f"{'at ms':>10} {'ms':>8}  statement"]
+    for offset, duration, statement in profile.queries:
+        lines.append(f"{offset * 1000:10.1f} {duration * 1000:8.2f}  {statement}")
+    return "\n".join(lines) + "\n"
+
+
+def format_collapsed(profile: Profile) -> str:
+    """Collapsed stacks in microseconds, for flamegraph.pl or speedscope."""
+    return "".join(
+        f"{';'.join(stack)} {round(seconds * 1_000_000)}\n" for stack, seconds in profile.stacks.items()
+    )
+
+
+def _profiling_requested(scope) -> bool:
+    for name, value in scope["headers"]:
+        if name == PROFILE_HEADER:
+            return value not in (b"", b"0", b"false")
+    query = scope.get("query_string", b"")
+    if PROFILE_QUERY_PARAM.encode() not in query:
+        return False
+    params = dict(parse_qsl(query.decode("latin-1")))
+    return params.get(PROFILE_QUERY_PARAM, "0") not in ("", "0", "false")
+
+
+def _admin_email(scope) -> Optional[str]:
+    """The logged-in admin's email, or None if the requester isn't an admin."""
+    db = SessionLocal()
+    try:
+        user = get_current_user(Request(scope), db)
+        return user.email if user and user.is_admin else None
+    finally:
+        db.close()
+
+
+class ProfilerMiddleware:
+    """
+    Profiles requests from admins who ask for it, plus a PROFILE_SAMPLE_RATE
+    fraction of all requests. Anything else passes straight through.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trigger, admin_email = None, None
+        if _profiling_requested(scope):
+            admin_email = _admin_email(scope)
+            if admin_email:
+                trigger = ON_DEMAND
+        if trigger is None and PROFILE_SAMPLE_RATE and random.random() < PROFILE_SAMPLE_RATE:
+            trigger = BACKGROUND
+        if trigger is None:
+            return await self.app(scope, receive, send)
+
+        profile = Profile(scope["method"], scope["path"], trigger, admin_email)
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status_code = message["status"]
+                if trigger == ON_DEMAND:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("X-Profile-Id", str(profile.id))
+                    headers.append("X-Profile-Url", f"/admin/profiles/{profile.id}")
+            await send(message)
+
+        token = _current.set(profile)
+        profiler.start(profile)
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop(profile)
+            _current.reset(token)
@@ -0,0 +1,151 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Tuple
+
+from fastapi import Request
+
+from database import SessionLocal
+from models import RateLimitBucket
+
+# "memory" keeps buckets per replica; "database" shares them across replicas
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+
+# Proxies in front of the app that append to X-Forwarded-For (0 = not behind one,
+# so the header is ignored: anyone can send it)
+TRUSTED_PROXY_HOPS = int(os.getenv("TRUSTED_PROXY_HOPS", "0"))
+
+MAX_BUCKETS = 50000          # In-memory buckets kept before the least recently used is evicted
+IDLE_BUCKET_SECONDS = 3600   # Database buckets untouched this long are deleted
+PRUNE_EVERY = 500            # Database takes between prune passes
+
+
+def _refill(tokens: float, updated_at: float, capacity: float, refill_rate: float, now: float) -> float:
+    return min(capacity, tokens + (now - updated_at) * refill_rate)
+
+
+def _take(tokens: float, refill_rate: float) -> Tuple[float, float]:
+    """Spend one token if available. Returns (tokens left, seconds to wait if refused)."""
+    if tokens >= 1:
+        return tokens - 1, 0.0
+    return tokens, (1 - tokens) / refill_rate
+
+
+class MemoryBackend:
+    """Token buckets in an LRU-ordered dict: O(1) lookups, bounded size."""
+
+    def __init__(self, max_buckets: int = MAX_BUCKETS):
+        self.max_buckets = max_buckets
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self.evicted = 0
+
+    def take(self, key: str, capacity: float, refill_rate: float, now: float) -> float:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            tokens = capacity
+        else:
+            tokens = _refill(bucket[0], bucket[1], capacity, refill_rate, now)
+            self.buckets.move_to_end(key)
+        tokens, retry_after = _take(tokens, refill_rate)
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_buckets:
+            # An evicted bucket was idle longest; recreating it full is harmless
+            self.buckets.popitem(last=False)
+            self.evicted += 1
+        return retry_after
+
+
+class DatabaseBackend:
+    """Token buckets in the shared database so every replica enforces the same limits."""
+
+    def __init__(self):
+        self.takes = 0
+        self.evicted = 0
+
+    def take(self, key: str, capacity: float, refill_rate: float, now: float) -> float:
+        db = SessionLocal()
+        try:
+            bucket = db.query(RateLimitBucket).filter(RateLimitBucket.key == key).with_for_update().first()
+            if bucket is None:
+                bucket = RateLimitBucket(key=key, tokens=capacity, updated_at=now)
+                db.add(bucket)
+            else:
+                bucket.tokens = _refill(bucket.tokens, bucket.updated_at, capacity, refill_rate, now)
+            bucket.tokens, retry_after = _take(bucket.tokens, refill_rate)
+            bucket.updated_at = now
+
+            self.takes += 1
+            if self.takes % PRUNE_EVERY == 0:
+                self.evicted += db.query(RateLimitBucket).filter(
+                    RateLimitBucket.updated_at < now - IDLE_BUCKET_SECONDS
+                ).delete(synchronize_session=False)
+            db.commit()
+            return retry_after
+        except Exception as e:
+            # Fail open: a database hiccup shouldn't lock everyone out
+            db.rollback()
+            print(f"Error checking rate limit for {key}: {e}")
+            return 0.0
+        finally:
+            db.close()
+
+
+backend = DatabaseBackend() if RATE_LIMIT_BACKEND == "database" else MemoryBackend()
+
+
+class RateLimiter:
+    """
+    A named token-bucket limit: bursts of up to `capacity` attempts per key,
+    refilled at `per_minute` attempts per minute.
+    """
+
+    def __init__(self, name: str, capacity: int, per_minute: float):
+        self.name = name
+        self.capacity = capacity
+        self.refill_rate = per_minute / 60
+        self.allowed = 0
+        self.limited = 0
+
+    def hit(self, key: str) -> float:
+        """Record an attempt. Returns 0 if allowed, otherwise seconds until the next one is."""
+        retry_after = backend.take(f"{self.name}:{key}", self.capacity, self.refill_rate, time.time())
+        if retry_after:
+            self.limited += 1
+        else:
+            self.allowed += 1
+        return retry_after
+
+
+login_by_ip = RateLimiter("login-ip", capacity=20, per_minute=10)
+login_by_email = RateLimiter("login-email", capacity=5, per_minute=1)
+register_by_email = RateLimiter("register-email", capacity=3, per_minute=1)
+# Loose: a whole office behind one NAT signs up when the invite goes out
+register_by_ip = RateLimiter("register-ip", capacity=100, per_minute=30)
+
+limiters = [login_by_ip, login_by_email, register_by_ip, register_by_email]
+
+
+def client_ip(request: Request) -> str:
+    """
+    The caller's address. Behind TRUSTED_PROXY_HOPS proxies it's the X-Forwarded-For
+    entry the outermost one added; anything before that is client-supplied.
+    """
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if TRUSTED_PROXY_HOPS and forwarded_for:
+        hops = [hop.strip() for hop in forwarded_for.split(",")]
+        if len(hops) >= TRUSTED_PROXY_HOPS:
+            return hops[-TRUSTED_PROXY_HOPS]
+    return request.client.host if request.client else "unknown"
+
+
+def get_metrics() -> Dict:
+    """Counters for the admin metrics endpoint."""
+    return {
+        "backend": RATE_LIMIT_BACKEND,
+        "buckets": len(backend.buckets) if isinstance(backend, MemoryBackend) else None,
+        "evicted": backend.evicted,
+        "limiters": {
+            limiter.name: {"allowed": limiter.allowed, "limited": limiter.limited}
+            for limiter in limiters
+        },
+    }
@@ -0,0 +1,135 @@
+import asyncio
+from typing import Dict, List, Union
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from database import SessionLocal, engine
+from models import Exchange, User
+from stats import invalidate_stats
+
+# Outcomes besides the new user's id
+REGISTRATION_CLOSED = "closed"
+EMAIL_TAKEN = "email_taken"
+
+MAX_BATCH_SIZE = 200  # Sign-ups written per commit
+
+
+def _insert_statement(rows: List[Dict]):
+    """Multi-row INSERT that skips emails already registered and returns what it inserted."""
+    if engine.dialect.name == "postgresql":
+        stmt = postgresql.insert(User).values(rows).on_conflict_do_nothing(index_elements=["email"])
+    elif engine.dialect.name == "sqlite":
+        stmt = sqlite.insert(User).values(rows).on_conflict_do_nothing(index_elements=["email"])
+    else:
+        return None
+    return stmt.returning(User.id, User.email)
+
+
+def commit_registrations(rows: List[Dict]) -> List[Union[int, str]]:
+    """
+    Insert a batch of sign-ups (possibly for several exchanges) in one transaction.
+    Returns one outcome per row: the new user id, REGISTRATION_CLOSED or EMAIL_TAKEN.
+    """
+    db = SessionLocal()
+    try:
+        # One query covers every exchange the batch signs up for
+        exchange_ids = {row["exchange_id"] for row in rows}
+        open_exchange_ids = {
+            exchange_id
+            for (exchange_id,) in db.query(Exchange.id).filter(
+                Exchange.id.in_(exchange_ids), Exchange.registration_open.is_(True)
+            )
+        }
+
+        # The first sign-up for an email within the batch wins
+        unique_rows = []
+        seen_emails = set()
+        for row in rows:
+            if row["exchange_id"] in open_exchange_ids and row["email"] not in seen_emails:
+                seen_emails.add(row["email"])
+                unique_rows.append(row)
+
+        stmt = _insert_statement(unique_rows) if unique_rows else None
+        if not unique_rows:
+            inserted = {}
+        elif stmt is not None:
+            inserted = {email: user_id for user_id, email in db.execute(stmt)}
+        else:
+            # No portable insert-or-conflict (or RETURNING, e.g. MySQL): fall back
+            # to a savepoint per row, letting the ORM fetch each new id
+            inserted = {}
+            for row in unique_rows:
+                user = User(**row)
+                try:
+                    with db.begin_nested():
+                        db.add(user)
+                        db.flush()
+                    inserted[row["email"]] = user.id
+                except IntegrityError:
+                    pass
+        db.commit()
+        for exchange_id in {row["exchange_id"] for row in unique_rows if row["email"] in inserted}:
+            invalidate_stats(exchange_id)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+    outcomes = []
+    for row in rows:
+        if row["exchange_id"] not in open_exchange_ids:
+            outcomes.append(REGISTRATION_CLOSED)
+            continue
+        user_id = inserted.pop(row["email"], None)
+        outcomes.append(user_id if user_id is not None else EMAIL_TAKEN)
+    return outcomes
+
+
+class RegistrationBatcher:
+    """
+    Group commit for sign-ups. While one batch is being written, new sign-ups
+    queue up and go out together in the next transaction, so a burst costs a
+    handful of round trips instead of several per registration.
+    """
+
+    def __init__(self):
+        self.queue: "asyncio.Queue" = None
+        self.worker = None
+        self.batches = 0
+        self.registrations = 0
+
+    async def submit(self, row: Dict) -> Union[int, str]:
+        """Queue a sign-up and wait for its outcome."""
+        loop = asyncio.get_running_loop()
+        # Start the worker on first use (and again if the event loop was replaced)
+        if self.worker is None or self.worker.done() or self.worker.get_loop() is not loop:
+            self.queue = asyncio.Queue()
+            self.worker = loop.create_task(self._run())
+        future = loop.create_future()
+        await self.queue.put((row, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < MAX_BATCH_SIZE and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            try:
+                outcomes = await asyncio.to_thread(commit_registrations, [row for row, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.registrations += len(batch)
+            for (_, future), outcome in zip(batch, outcomes):
+                if not future.done():
+                    future.set_result(outcome)
+
+
+registrations = RegistrationBatcher()
@@ -1,11 +1,22 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, status
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse, PlainTextResponse
 from sqlalchemy.orm import Session
 
 from database import get_db
-from models import User, Settings
+from models import User, Exchange
 from pairing import create_pairings, reshuffle_all_pairings, assign_users_without_pairs
 from routers.users import get_current_user
+import ratelimit
+import admission
+from stats import get_stats
+from profiler import profiler, format_report, format_collapsed
+from events import (
+    publish_event,
+    PAIRINGS_CREATED,
+    ASSIGNED,
+    REGISTRATION_OPENED,
+    REGISTRATION_CLOSED,
+)
 
 router = APIRouter(prefix="/admin", tags=["admin"])
 
@@ -24,16 +35,14 @@ async def toggle_registration(request: Request, db: Session = Depends(get_db)):
         # Redirect back to dashboard with error
         return RedirectResponse(url="/dashboard?error=Admin access required", status_code=status.HTTP_302_FOUND)
 
-    # Toggle registration status
-    registration_setting = db.query(Settings).filter(Settings.key == "registration_open").first()
-    if registration_setting:
-        new_value = "false" if registration_setting.value.lower() == "true" else "true"
-        registration_setting.value = new_value
-    else:
-        registration_setting = Settings(key="registration_open", value="false")
-        db.add(registration_setting)
+    # Toggle registration status for the admin's exchange
+    exchange = db.get(Exchange, user.exchange_id)
+    exchange.registration_open = not exchange.registration_open
+    is_open = exchange.registration_open
     db.commit()
 
+    publish_event(db, REGISTRATION_OPENED if is_open else REGISTRATION_CLOSED, user.exchange_id)
+
     return RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
 
 
@@ -51,19 +60,24 @@ async def admin_create_pairings(request: Request, db: Session = Depends(get_db))
         # Redirect back to dashboard with error (we'll show error on dashboard)
         return RedirectResponse(url="/dashboard?error=Admin access required", status_code=status.HTTP_302_FOUND)
 
+    # Pairing actions only ever touch the admin's own exchange
+    exchange_id = user.exchange_id
+
     # Check if any pairings already exist
     from pairing import pairing_exists
-    if pairing_exists(db):
+    if pairing_exists(db, exchange_id):
         return RedirectResponse(
             url="/dashboard?error=Cannot create pairings when some users already have pairs. Use 'Assign Unpaired Users' instead.",
             status_code=status.HTTP_302_FOUND
         )
 
-    result = create_pairings(db)
+    result = create_pairings(db, exchange_id)
     if not result["success"]:
         # Redirect with error message
         return RedirectResponse(url=f"/dashboard?error={result.get('message', 'Failed to create pairings')}", status_code=status.HTTP_302_FOUND)
 
+    publish_event(db, PAIRINGS_CREATED, exchange_id)
+
     return RedirectResponse(url="/dashboard?success=Pairings created successfully", status_code=status.HTTP_302_FOUND)
 
 
@@ -79,10 +93,13 @@ async def admin_reshuffle_pairings(request: Request, db: Session = Depends(get_d
     if not user.is_admin:
         return RedirectResponse(url="/dashboard?error=Admin access required", status_code=status.HTTP_302_FOUND)
 
-    result = reshuffle_all_pairings(db)
+    exchange_id = user.exchange_id
+    result = reshuffle_all_pairings(db, exchange_id)
     if not result["success"]:
         return RedirectResponse(url=f"/dashboard?error={result.get('message', 'Failed to reshuffle pairings')}", status_code=status.HTTP_302_FOUND)
 
+    publish_event(db, PAIRINGS_CREATED, exchange_id)
+
     return RedirectResponse(url="/dashboard?success=All pairings reshuffled successfully", status_code=status.HTTP_302_FOUND)
 
 
@@ -98,9 +115,70 @@ async def admin_assign_users_without_pairs(request: Request, db: Session = Depen
     if not user.is_admin:
         return RedirectResponse(url="/dashboard?error=Admin access required", status_code=status.HTTP_302_FOUND)
 
-    result = assign_users_without_pairs(db)
+    exchange_id = user.exchange_id
+    result = assign_users_without_pairs(db, exchange_id)
     if not result["success"]:
         return RedirectResponse(url=f"/dashboard?error={result.get('message', 'Failed to assign users')}", status_code=status.HTTP_302_FOUND)
 
+    if result.get("assigned_user_ids"):
+        publish_event(db, ASSIGNED, exchange_id, user_ids=result["assigned_user_ids"])
+
     return RedirectResponse(url=f"/dashboard?success={result.get('message', 'Users assigned successfully')}", status_code=status.HTTP_302_FOUND)
 
+
+
+@router.get("/rate-limits")
+async def admin_rate_limits(request: Request, db: Session = Depends(get_db)):
+    """Login/registration throttling counters (admin only)."""
+    user = get_current_user(request, db)
+    if not user or not user.is_admin:
+        return JSONResponse({"detail": "Admin access required"}, status_code=status.HTTP_403_FORBIDDEN)
+
+    return ratelimit.get_metrics()
+
+
+@router.get("/admission")
+async def admin_admission(request: Request, db: Session = Depends(get_db)):
+    """Admission control counters: requests admitted, queued and shed per route class (admin only)."""
+    user = get_current_user(request, db)
+    if not user or not user.is_admin:
+        return JSONResponse({"detail": "Admin access required"}, status_code=status.HTTP_403_FORBIDDEN)
+
+    return admission.get_metrics()
+
+
+@router.get("/stats")
+async def admin_stats(request: Request, db: Session = Depends(get_db)):
+    """Membership and pairing statistics for the admin's exchange (admin only)."""
+    user = get_current_user(request, db)
+    if not user or not user.is_admin:
+        return JSONResponse({"detail": "Admin access required"}, status_code=status.HTTP_403_FORBIDDEN)
+
+    return get_stats(db, user.exchange_id)
+
+
+@router.get("/profiles")
+async def admin_profiles(request: Request, db: Session = Depends(get_db)):
+    """Recent request profiles on this replica (admin only)."""
+    user = get_current_user(request, db)
+    if not user or not user.is_admin:
+        return JSONResponse({"detail": "Admin access required"}, status_code=status.HTTP_403_FORBIDDEN)
+
+    return profiler.get_metrics()
+
+
+@router.get("/profiles/{profile_id}")
+async def admin_profile(request: Request, profile_id: int, format: str = "text", db: Session = Depends(get_db)):
+    """Download one profile report; ?format=collapsed gives flame graph input (admin only)."""
+    user = get_current_user(request, db)
+    if not user or not user.is_admin:
+        return JSONResponse({"detail": "Admin access required"}, status_code=status.HTTP_403_FORBIDDEN)
+
+    profile = profiler.get_report(profile_id)
+    if profile is None:
+        return JSONResponse({"detail": "Profile not found"}, status_code=status.HTTP_404_NOT_FOUND)
+
+    collapsed = format == "collapsed"
+    body = format_collapsed(profile) if collapsed else format_report(profile)
+    filename = f"profile-{profile_id}.{'folded' if collapsed else 'txt'}"
+    return PlainTextResponse(body, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -1,21 +1,29 @@
 from fastapi import APIRouter, Request, Depends, Form, status, HTTPException
-from fastapi.responses import HTMLResponse, RedirectResponse
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Optional
 
-from database import get_db
-from models import User, Settings, Pairing
+from database import get_db, SessionLocal
+from models import User, Exchange
 from auth import (
-    authenticate_user,
+    verify_password,
     get_password_hash,
     create_access_token,
     get_current_user_from_token,
+    run_bcrypt,
 )
-from pairing import get_user_pairing, pairing_exists
+from pairing_index import get_pairing_index
+from exchanges import DEFAULT_EXCHANGE_SLUG, get_exchange_for_registration
+from events import broadcaster, event_stream, latest_event_id
+from templating import templates, prerender, stream_template
+from ratelimit import client_ip, login_by_ip, login_by_email, register_by_ip, register_by_email
+from registration import registrations, REGISTRATION_CLOSED, EMAIL_TAKEN
+from admission import AUTH, Shed, route_classes, server_busy
 
 router = APIRouter()
-templates = Jinja2Templates(directory="templates")
+
+# The login page is identical for every visitor unless there's an error to show
+index_page = prerender("index.html")
 
 
 def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optional[User]:
@@ -41,10 +49,37 @@ def get_current_user(request: Request, db: Session = Depends(get_db)) -> Optiona
         return None
 
 
+def too_many_attempts(request: Request, retry_after: float):
+    """Fast rejection for throttled login/registration attempts - no password hashing."""
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "error": "Too many attempts. Please wait a minute and try again.",
+        },
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={"Retry-After": str(int(retry_after) + 1)},
+    )
+
+
+def registration_closed(request: Request, exchange: str):
+    """The sign-up form again, for an exchange that isn't taking registrations."""
+    return templates.TemplateResponse(
+        "index.html",
+        {
+            "request": request,
+            "error": "Registration is currently closed.",
+            "exchange": exchange,
+        },
+    )
+
+
 @router.get("/", response_class=HTMLResponse)
-async def index(request: Request):
-    """Login/Registration page."""
-    return templates.TemplateResponse("index.html", {"request": request})
+async def index(request: Request, exchange: Optional[str] = None):
+    """Login/Registration page. ?exchange=<slug> registers new members into that exchange."""
+    if not exchange or exchange == DEFAULT_EXCHANGE_SLUG:
+        return index_page.response(request)
+    return templates.TemplateResponse("index.html", {"request": request, "exchange": exchange})
 
 
 @router.post("/register")
@@ -55,52 +90,73 @@ async def register(
     email: str = Form(...),
     phone_number: str = Form(...),
     password: str = Form(...),
+    exchange: str = Form(DEFAULT_EXCHANGE_SLUG),
     db: Session = Depends(get_db),
 ):
     """Register a new user."""
-    # Check if registration is open
-    registration_setting = db.query(Settings).filter(Settings.key == "registration_open").first()
-    if registration_setting and registration_setting.value.lower() != "true":
+    # Throttle before any database work or bcrypt hashing
+    retry_after = register_by_email.hit(email.strip().lower()) or register_by_ip.hit(client_ip(request))
+    if retry_after:
+        return too_many_attempts(request, retry_after)
+
+    target = get_exchange_for_registration(db, exchange)
+    if target is None:
         return templates.TemplateResponse(
             "index.html",
             {
                 "request": request,
-                "error": "Registration is currently closed.",
+                "error": "That gift exchange doesn't exist. Please check your registration link.",
             },
         )
+    exchange_id, registration_open = target
+    # Turn sign-ups for a closed exchange away before paying for bcrypt
+    if not registration_open:
+        return registration_closed(request, exchange)
+
+    # Return the connection to the pool (the batch commits with its own), then
+    # hash off the event loop so concurrent sign-ups can gather into one batch
+    db.close()
+    try:
+        # Share login's bcrypt budget, but release the slot before joining the batch
+        async with route_classes[AUTH].limit():
+            hashed_password = await run_bcrypt(get_password_hash, password)
+    except Shed as shed:
+        return server_busy(request, shed.retry_after)
 
-    # Check if user already exists
-    existing_user = db.query(User).filter(User.email == email).first()
-    if existing_user:
+    # Create new user - the group commit re-checks registration (it may have
+    # closed while this one hashed) and detects duplicate emails via the
+    # unique constraint
+    outcome = await registrations.submit(
+        {
+            "first_name": first_name,
+            "last_name": last_name,
+            "email": email,
+            "phone_number": phone_number,
+            "hashed_password": hashed_password,
+            "is_admin": False,
+            "exchange_id": exchange_id,
+        }
+    )
+    if outcome == REGISTRATION_CLOSED:
+        return registration_closed(request, exchange)
+    if outcome == EMAIL_TAKEN:
         return templates.TemplateResponse(
             "index.html",
             {
                 "request": request,
                 "error": "Email already registered. Please log in instead.",
+                "exchange": exchange,
             },
         )
-
-    # Create new user
-    hashed_password = get_password_hash(password)
-    new_user = User(
-        first_name=first_name,
-        last_name=last_name,
-        email=email,
-        phone_number=phone_number,
-        hashed_password=hashed_password,
-        is_admin=False,
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    new_user_id = outcome
 
     # Note: New users are NOT automatically assigned if pairings exist
     # Admin must use "Assign Users Without Pairs" to assign them
 
     # Create access token and set cookie
     # JWT 'sub' claim must be a string, so convert user.id to string
-    access_token = create_access_token(data={"sub": str(new_user.id)})
-    print(f"DEBUG: Created token for user {new_user.id}: {access_token[:50]}...")
+    access_token = create_access_token(data={"sub": str(new_user_id)})
+    print(f"DEBUG: Created token for user {new_user_id}: {access_token[:50]}...")
     response = RedirectResponse(url="/dashboard", status_code=status.HTTP_302_FOUND)
     response.set_cookie(
         key="access_token",
@@ -123,8 +179,16 @@ async def login(
     db: Session = Depends(get_db),
 ):
     """Login user."""
-    user = authenticate_user(db, email, password)
-    if not user:
+    # Throttle before bcrypt verification burns CPU
+    retry_after = login_by_ip.hit(client_ip(request)) or login_by_email.hit(email.strip().lower())
+    if retry_after:
+        return too_many_attempts(request, retry_after)
+
+    user = db.query(User.id, User.hashed_password).filter(User.email == email).first()
+    # Return the connection to the pool, then verify off the event loop so a
+    # burst of logins can't stall every other request
+    db.close()
+    if not user or not await run_bcrypt(verify_password, password, user.hashed_password):
         return templates.TemplateResponse(
             "index.html",
             {
@@ -158,54 +222,89 @@ async def dashboard(request: Request, db: Session = Depends(get_db)):
     if not user:
         return RedirectResponse(url="/", status_code=status.HTTP_302_FOUND)
 
+    # Everything below is limited to the member's own exchange
+    exchange = db.get(Exchange, user.exchange_id)
+
     # Get all users
-    all_users = db.query(User).all()
+    all_users = db.query(User).filter(User.exchange_id == exchange.id).all()
+
+    # Pairings come from this replica's in-memory index, not the database
+    pairing_index = get_pairing_index(db, exchange.id)
 
     # Get user's pairing
-    pairing = get_user_pairing(db, user.id)
-    assigned_person = None
-    if pairing:
-        assigned_person = db.query(User).filter(User.id == pairing.receiver_id).first()
+    assigned_person = pairing_index.lookup(user.id)
 
     # Check if pairings exist
-    pairings_exist = pairing_exists(db)
+    pairings_exist = pairing_index.count > 0
 
     # Get pairing status for all users (for admin view)
     # Create a dictionary mapping user_id -> has_pairing
-    user_pairing_status = {}
-    if pairings_exist:
-        all_pairings = db.query(Pairing).all()
-        users_with_pairings = {p.gifter_id for p in all_pairings}
-        for u in all_users:
-            user_pairing_status[u.id] = u.id in users_with_pairings
-    else:
-        for u in all_users:
-            user_pairing_status[u.id] = False
+    user_pairing_status = {u.id: pairing_index.has_pairing(u.id) for u in all_users}
 
     # Get registration status
-    registration_setting = db.query(Settings).filter(Settings.key == "registration_open").first()
-    registration_open = registration_setting.value.lower() == "true" if registration_setting else True
+    registration_open = exchange.registration_open
+
+    # The page's live-update stream sends only events newer than this render
+    last_event_id = latest_event_id(db)
 
     # Get error/success messages from query parameters
     error_message = request.query_params.get("error")
     success_message = request.query_params.get("success")
 
-    return templates.TemplateResponse(
+    return stream_template(
         "dashboard.html",
         {
             "request": request,
             "user": user,
+            "exchange": exchange,
             "all_users": all_users,
             "assigned_person": assigned_person,
             "pairings_exist": pairings_exist,
             "registration_open": registration_open,
             "user_pairing_status": user_pairing_status,
+            "last_event_id": last_event_id,
             "error_message": error_message,
             "success_message": success_message,
         },
     )
 
 
+@router.get("/events")
+async def events(request: Request, since: Optional[int] = None):
+    """
+    Server-Sent Events stream of pairing and registration updates published
+    after event `since` (the dashboard passes the latest id it rendered with).
+    """
+    # Authenticate with a short-lived session so an open stream doesn't hold a pooled connection
+    db = SessionLocal()
+    try:
+        user = get_current_user(request, db)
+        # A reconnecting browser resumes from the last event it received
+        last_seen = request.headers.get("last-event-id")
+        if last_seen and last_seen.isdigit():
+            since = int(last_seen)
+        elif since is None:
+            since = latest_event_id(db) if user else 0
+    finally:
+        db.close()
+    if not user:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+
+    subscriber = broadcaster.subscribe(user.id, user.exchange_id, since)
+    if subscriber is None:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many live connections",
+            headers={"Retry-After": "30"},
+        )
+
+    return StreamingResponse(
+        event_stream(request, subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/logout")
 async def logout():
     """Logout user."""
@@ -19,6 +19,11 @@ document.addEventListener('DOMContentLoaded', function() {
     
     // Add button ripple effects
     addRippleEffects();
+    
+    // Refresh the dashboard when pairings or registration change
+    if (document.body.dataset.liveUpdates) {
+        subscribeToLiveUpdates();
+    }
 });
 
 // Create animated snowflakes for login/registration page
@@ -199,6 +204,26 @@ function addRippleEffects() {
     });
 }
 
+// Listen for server-pushed pairing and registration updates
+function subscribeToLiveUpdates() {
+    if (!window.EventSource) {
+        return;
+    }
+    
+    // Pick up from the last event this page was rendered with, so nothing
+    // published while the page was loading is missed
+    const since = document.body.dataset.lastEventId;
+    const source = new EventSource(since ? '/events?since=' + encodeURIComponent(since) : '/events');
+    const events = ['pairings_created', 'assigned', 'registration_opened', 'registration_closed'];
+    
+    events.forEach(name => {
+        source.addEventListener(name, function() {
+            source.close();
+            window.location.reload();
+        });
+    });
+}
+
 // Add CSS for ripple effect
 const style = document.createElement('style');
 style.textContent = `
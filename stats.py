@@ -0,0 +1,83 @@
+import time
+from typing import Dict, List, Tuple
+
+from sqlalchemy import case, func
+from sqlalchemy.orm import Session, aliased
+
+from models import User, Pairing
+
+STATS_TTL_SECONDS = 30  # How stale another replica's changes can make the cached stats
+
+
+def member_counts(db: Session, exchange_id: int) -> Dict[str, int]:
+    """Total members and admins, in one aggregate query."""
+    total, admins = db.query(
+        func.count(User.id),
+        func.coalesce(func.sum(case((User.is_admin.is_(True), 1), else_=0)), 0),
+    ).filter(User.exchange_id == exchange_id).one()
+    return {"total_members": total, "admins": admins}
+
+
+def gifter_counts(db: Session, exchange_id: int) -> Dict[str, int]:
+    """Members who are / aren't gifting to anyone yet, in one aggregate query."""
+    total, paired = (
+        db.query(func.count(User.id), func.count(Pairing.id))
+        .outerjoin(Pairing, Pairing.gifter_id == User.id)
+        .filter(User.exchange_id == exchange_id)
+        .one()
+    )
+    return {"paired_gifters": paired, "unpaired_gifters": total - paired}
+
+
+def receivers_without_gifter(db: Session, exchange_id: int) -> int:
+    """Members nobody is gifting to, in one anti-join query."""
+    gifting_to = aliased(Pairing)
+    return (
+        db.query(func.count(User.id))
+        .outerjoin(gifting_to, gifting_to.receiver_id == User.id)
+        .filter(User.exchange_id == exchange_id, gifting_to.id.is_(None))
+        .scalar()
+    )
+
+
+def registrations_by_day(db: Session, exchange_id: int) -> List[Dict]:
+    """Sign-ups per day, oldest first, in one grouped query. Members from before
+    sign-up dates were recorded are reported under a null day."""
+    day = func.date(User.created_at)
+    rows = (
+        db.query(day, func.count(User.id))
+        .filter(User.exchange_id == exchange_id)
+        .group_by(day)
+        .order_by(day)
+        .all()
+    )
+    return [{"day": str(d) if d is not None else None, "registrations": count} for d, count in rows]
+
+
+def compute_stats(db: Session, exchange_id: int) -> Dict:
+    stats = {}
+    stats.update(member_counts(db, exchange_id))
+    stats.update(gifter_counts(db, exchange_id))
+    stats["receivers_without_gifter"] = receivers_without_gifter(db, exchange_id)
+    stats["registrations_by_day"] = registrations_by_day(db, exchange_id)
+    return stats
+
+
+# exchange_id -> (stats, monotonic time computed)
+_cache: Dict[int, Tuple[Dict, float]] = {}
+
+
+def get_stats(db: Session, exchange_id: int) -> Dict:
+    """Cached admin stats for an exchange, recomputed after local changes or STATS_TTL_SECONDS."""
+    now = time.monotonic()
+    cached = _cache.get(exchange_id)
+    if cached is not None and now - cached[1] < STATS_TTL_SECONDS:
+        return cached[0]
+    stats = compute_stats(db, exchange_id)
+    _cache[exchange_id] = (stats, now)
+    return stats
+
+
+def invalidate_stats(exchange_id: int):
+    """Drop an exchange's cached stats after its members or pairings change."""
+    _cache.pop(exchange_id, None)
@@ -0,0 +1,91 @@
+import gzip
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, Iterator, Optional
+
+import jinja2
+from fastapi import Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.templating import Jinja2Templates
+
+from assets import accepts_encoding, etag_matches, static_assets
+
+TEMPLATE_DIR = "templates"
+
+# Compiled template bytecode survives restarts, so cold replicas skip Jinja's parser
+BYTECODE_CACHE_DIR = os.getenv(
+    "TEMPLATE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "santa-jinja-cache")
+)
+
+STREAM_CHUNK_SIZE = 16 * 1024  # Bytes buffered before each chunk of a streamed page is sent
+
+os.makedirs(BYTECODE_CACHE_DIR, exist_ok=True)
+
+env = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATE_DIR),
+    autoescape=True,
+    bytecode_cache=jinja2.FileSystemBytecodeCache(BYTECODE_CACHE_DIR),
+    # Templates only change on deploy; don't stat the files on every render
+    auto_reload=False,
+    cache_size=-1,
+)
+# {{ asset_url('styles.css') }} resolves to the fingerprinted file name
+env.globals["asset_url"] = static_assets.url
+templates = Jinja2Templates(env=env)
+
+
+def compile_templates():
+    """Load and compile every template once so no request pays for it."""
+    for name in env.list_templates(extensions=["html"]):
+        env.get_template(name)
+
+
+class PrerenderedPage:
+    """A fully rendered page kept in memory as raw and gzip-compressed bytes."""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.gzipped = gzip.compress(body, compresslevel=9)
+        self.digest = hashlib.sha256(body).hexdigest()[:16]
+
+    def response(self, request: Request) -> Response:
+        """Serve the page, compressed if the client accepts it, with ETag revalidation."""
+        # Like static assets, each encoding gets its own ETag
+        if accepts_encoding(request, "gzip"):
+            body, encoding, etag = self.gzipped, "gzip", f'"{self.digest}-gz"'
+        else:
+            body, encoding, etag = self.body, None, f'"{self.digest}"'
+
+        headers = {"ETag": etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        return Response(body, media_type="text/html", headers=headers)
+
+
+def prerender(name: str, context: Optional[Dict[str, Any]] = None) -> PrerenderedPage:
+    """Render a template that doesn't depend on the request once, up front."""
+    return PrerenderedPage(env.get_template(name).render(context or {}).encode("utf-8"))
+
+
+def _buffered(chunks: Iterator[str]) -> Iterator[bytes]:
+    """Group Jinja's many small output fragments into fewer, larger chunks."""
+    buffer = []
+    size = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= STREAM_CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+
+def stream_template(name: str, context: Dict[str, Any]) -> StreamingResponse:
+    """Render a template incrementally so large pages start arriving before they finish."""
+    template = env.get_template(name)
+    return StreamingResponse(_buffered(template.generate(context)), media_type="text/html")